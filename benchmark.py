@@ -0,0 +1,242 @@
+"""Throughput benchmark: replay both pipelines against fake LLM backends with a chosen latency distribution.
+
+Usage:
+    python benchmark.py --pipeline both --items 100 --workers 8 --latency lognormal --mean 0.2 --spread 0.5 \
+        --output bench.json
+    python benchmark.py ... --baseline bench.json   # exit code 1 if throughput dropped by more than --tolerance
+
+create_data runs run_pipeline() (generation, dedup, prefilter, rating) and chain_of_density runs
+BatchRunner (base summary, entities, one-step summary, densify). Both go through the real LLMClient,
+caches and instrumentation; only the backend is fake. Its answers come from fake_backend.py and
+llm_stub_server.py, and every call sleeps for a latency drawn from:
+- constant: always `mean` seconds
+- uniform: between mean - spread and mean + spread
+- lognormal: mean `mean`, with `spread` as the sigma of the underlying normal (long tail)
+
+The report has items per second per pipeline plus the per-stage instrumentation summary
+(p50/p95/p99 wall time and queue wait, tokens, retries). A report saved with --output can be passed
+as --baseline to a later run.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "create_data"), os.path.join(ROOT, "chain_of_density_summarization")]
+# every chain-of-density call should reach the (fake) backend, not be answered from recorded responses
+os.environ.setdefault("COD_CACHE_MODE", "live")
+
+from instrumentation import metrics
+from llm_client import LLMClient, estimate_tokens, set_client
+from llm_stub_server import canned_answer
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+TOLERANCE = 0.1  # a throughput drop of more than 10% against the baseline counts as a regression
+ARTICLE_NAMES = ["Anna Erickson", "Bud Dodson", "John Warden", "Maria Lopez", "Wei Chen", "Omar Haddad"]
+ARTICLE_PLACES = ["Seattle", "Portland", "Chicago", "Denver", "Boston", "Austin"]
+ARTICLE_ORGS = ["Starbucks", "Safeco Field", "DailyMail", "City Council", "Red Cross", "Boeing"]
+
+
+class LatencyModel:
+    """Draws per-call latencies (in seconds) from a constant, uniform or lognormal distribution."""
+
+    def __init__(self, distribution="constant", mean=0.05, spread=0.0, seed=0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution!r}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.distribution = distribution
+        self.mean = mean
+        self.spread = spread
+        self.rng = random.Random(seed)
+
+    def sample(self):
+        if self.distribution == "uniform":
+            return self.rng.uniform(max(0.0, self.mean - self.spread), self.mean + self.spread)
+        if self.distribution == "lognormal" and self.mean > 0:
+            # mu chosen so the distribution's mean (not its median) is self.mean
+            return self.rng.lognormvariate(math.log(self.mean) - self.spread ** 2 / 2, self.spread)
+        return self.mean
+
+
+class FakeStreamBackend:
+    """Stands in for ReplicateBackend: streams fake_backend.py's seeded conversations / ratings word by word."""
+
+    model = "fake-mistral"
+
+    def __init__(self, latency, seed=0):
+        from fake_backend import make_fake_mistral
+
+        self.latency = latency
+        self.fake_mistral = make_fake_mistral(seed=seed)
+
+    def stream(self, prompt, max_new_tokens):
+        time.sleep(self.latency.sample())
+        text = self.fake_mistral(prompt)[len("ASSISTANT: "):]
+        return iter(re.findall(r"\S+\s*", text)[:max_new_tokens])
+
+
+class FakeChatBackend:
+    """Stands in for OpenAICompatibleBackend with llm_stub_server.py's canned answers and usage counts."""
+
+    model = "fake-chat"
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def chat(self, messages, temperature=0, max_tokens=None):
+        time.sleep(self.latency.sample())
+        content = canned_answer(messages)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content)},
+        }
+
+
+def synthetic_articles(num_articles, seed=0):
+    """Entity-rich fake news articles, so entity extraction and densify have something to work with."""
+    rng = random.Random(seed)
+    for article_id in range(num_articles):
+        sentences = []
+        for _ in range(20):
+            sentences.append(
+                f"{rng.choice(ARTICLE_NAMES)} from {rng.choice(ARTICLE_PLACES)} met {rng.choice(ARTICLE_NAMES)} "
+                f"at {rng.choice(ARTICLE_ORGS)} on day {rng.randint(1, 28)}, and {rng.randint(2, 90)} people joined them."
+            )
+        yield {"id": article_id, "text": " ".join(sentences)}
+
+
+def bench_create_data(args, latency):
+    import data_creation
+    from dedup import DedupIndex
+    from prefilter import PrefilterCascade
+
+    set_client("replicate", LLMClient(FakeStreamBackend(latency, args.seed), max_concurrency=args.workers))
+    dedup_index = DedupIndex(threshold=data_creation.DEDUP_THRESHOLD) if data_creation.DEDUP_THRESHOLD is not None else None
+    prefilter = PrefilterCascade(
+        reject_confidence=data_creation.PREFILTER_REJECT_CONFIDENCE,
+        accept_confidence=data_creation.PREFILTER_ACCEPT_CONFIDENCE,
+        accept_quality=data_creation.QUALITY_THRESHOLD,
+    )
+    records = data_creation.run_pipeline(
+        num_conversations=args.items,
+        num_workers=args.workers,
+        requests_per_second=args.requests_per_second,
+        burst_size=args.workers,
+        seed=args.seed,
+        resume=False,
+        dedup_index=dedup_index,
+        prefilter=prefilter,
+    )
+    failed = sum("error" in record for record in records)
+    return args.items - failed, failed
+
+
+def bench_cod(args, latency):
+    import batch_cod
+    import main as cod
+
+    set_client(cod.agent.llm, LLMClient(FakeChatBackend(latency), max_concurrency=args.workers))
+    runner = batch_cod.BatchRunner(concurrency=args.workers)
+    counts = asyncio.run(runner.run(synthetic_articles(args.items, args.seed), "cod_results.jsonl"))
+    return counts["done"], counts["failed"]
+
+
+PIPELINES = {"create_data": bench_create_data, "chain_of_density": bench_cod}
+
+
+def run_benchmark(args):
+    report = {"config": {key: getattr(args, key) for key in
+                         ("items", "workers", "latency", "mean", "spread", "seed", "requests_per_second")},
+              "pipelines": {}}
+    names = list(PIPELINES) if args.pipeline == "both" else [args.pipeline]
+    for name in names:
+        metrics.reset()
+        latency = LatencyModel(args.latency, args.mean, args.spread, args.seed)
+        start = time.perf_counter()
+        done, failed = PIPELINES[name](args, latency)
+        seconds = time.perf_counter() - start
+        summary = metrics.summary()
+        report["pipelines"][name] = {
+            "items": done,
+            "failed": failed,
+            "seconds": seconds,
+            "items_per_second": done / seconds if seconds else 0.0,
+            "calls_per_second": summary["total"]["calls"] / seconds if seconds else 0.0,
+            "metrics": summary,
+        }
+    return report
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """Return a list of regression messages: pipelines whose items per second dropped by more than `tolerance`."""
+    if baseline.get("config") != report["config"]:
+        print(f"Warning: baseline config {baseline.get('config')} differs from this run's {report['config']}")
+    regressions = []
+    for name, result in report["pipelines"].items():
+        previous = baseline.get("pipelines", {}).get(name)
+        if previous is None:
+            continue
+        change = result["items_per_second"] / previous["items_per_second"] - 1 if previous["items_per_second"] else 0.0
+        print(f"{name:>16}: {previous['items_per_second']:.2f} -> {result['items_per_second']:.2f} items/s ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(f"{name} throughput dropped {-change:.1%} (more than {tolerance:.0%})")
+    return regressions
+
+
+def print_report(report):
+    for name, result in report["pipelines"].items():
+        print(f"{name}: {result['items']} items ({result['failed']} failed) in {result['seconds']:.2f}s, "
+              f"{result['items_per_second']:.2f} items/s, {result['calls_per_second']:.2f} calls/s")
+        for stage, stats in result["metrics"]["stages"].items():
+            wall = stats["wall_seconds"]
+            print(f"  {stage:>18}: {stats['calls']:5d} calls  p50 {wall['p50'] * 1000:8.1f} ms  "
+                  f"p95 {wall['p95'] * 1000:8.1f} ms  p99 {wall['p99'] * 1000:8.1f} ms  "
+                  f"queue p95 {stats['queue_wait_seconds']['p95'] * 1000:8.1f} ms  "
+                  f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pipeline", choices=["both", *PIPELINES], default="both")
+    parser.add_argument("--items", type=int, default=50, help="conversations / articles per pipeline")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="constant")
+    parser.add_argument("--mean", type=float, default=0.05, help="mean fake call latency in seconds")
+    parser.add_argument("--spread", type=float, default=0.0, help="uniform half-width, or lognormal sigma")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests-per-second", type=float, default=1000.0,
+                        help="create_data's request rate limit (high by default so it does not cap throughput)")
+    parser.add_argument("--output", help="write the report here (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="earlier report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    with tempfile.TemporaryDirectory() as workdir:
+        # pipeline caches and outputs land in a scratch directory, so every run starts cold
+        os.chdir(workdir)
+        report = run_benchmark(args)
+        os.chdir(ROOT)
+    print_report(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
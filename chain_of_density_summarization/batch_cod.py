@@ -0,0 +1,158 @@
+"""Run the chain-of-density pipeline over a JSONL corpus of articles.
+
+Usage:
+    python batch_cod.py articles.jsonl --output results.jsonl --concurrency 8
+
+Every input line is {"id": ..., "text": ...} ("id" defaults to the line number). For each article,
+base_summary, extract_entities and dense_summary do not depend on each other and run at the same
+time; densify (the adaptive increase_density loop) runs once the base summary and entities are ready,
+and its per-iteration coverage, tokens and latency are saved with the result. Steps of different
+articles run concurrently too, with at most `concurrency` LLM calls in flight overall, and each
+finished article is appended to the output file right away (articles already there are skipped; a
+half-written last line left by a crash is cut off first, see checkpoint.py).
+Transient API errors are retried with backoff by the shared client (llm_client.py); an article whose
+calls still fail is logged and left out of the output, so the next run picks it up again.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main as cod
+from checkpoint import JsonlCheckpointWriter, read_records
+from instrumentation import metrics
+from llm_client import MAX_RETRIES
+
+MAX_CONCURRENT_CALLS = cod.MAX_CONCURRENT_CALLS
+EVALUATION_THREADS = 2  # worker threads on top of the call slots, so evaluations never wait behind LLM calls
+
+
+def read_articles(path, skip=()):
+    """Yield {"id", "text"} articles from a JSONL file, lazily, leaving out ids in `skip`."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            article = json.loads(line)
+            article.setdefault("id", line_number)
+            if article["id"] not in skip:
+                yield article
+
+
+def finished_ids(path):
+    # a half-written last line left by a crash does not parse and is skipped; run() cuts it off before appending
+    return {record["id"] for record in read_records(path)}
+
+
+class BatchRunner:
+    """Schedules the per-article call graph with a global limit on concurrent LLM calls."""
+
+    def __init__(self, concurrency=MAX_CONCURRENT_CALLS, max_iterations=cod.MAX_DENSITY_ITERATIONS):
+        self.concurrency = concurrency
+        self.max_iterations = max_iterations
+        self.semaphore = None
+
+    async def call(self, fn, *args):
+        """Run a blocking pipeline step in a worker thread (the client retries transient API errors)."""
+        async with self.semaphore:
+            return await asyncio.to_thread(fn, *args)
+
+    async def process_article(self, article):
+        start = time.perf_counter()
+        text = article["text"]
+        initial_summary, entities, one_step_summary = await asyncio.gather(
+            self.call(cod.base_summary, text),
+            self.call(cod.extract_entities, text),
+            self.call(cod.dense_summary, text),
+        )
+        # densify makes its increase_density calls one after another, so it holds a single call slot
+        iterations, density_history = await self.call(
+            cod.densify, initial_summary, entities, len(initial_summary), self.max_iterations)
+
+        summaries = {"initial": iterations[0]}
+        summaries.update({f"iteration {i}": summary for i, summary in enumerate(iterations[1:-1], start=1)})
+        summaries.update({"final": iterations[-1], "one step": one_step_summary})
+        # pure-Python scoring (Aho-Corasick, n-gram hashing) would stall every other article on the event loop,
+        # and it makes no LLM call, so it runs in a worker thread without taking a call slot
+        evaluation = await asyncio.to_thread(
+            cod.evaluate_summaries,
+            {key: {"text": text, "summary": summary} for key, summary in summaries.items()},
+            known_entities={text: entities},
+        )
+        return {
+            "id": article["id"],
+            "entities": entities,
+            "summaries": summaries,
+            "evaluation": evaluation,
+            "density_history": density_history,
+            "seconds": time.perf_counter() - start,
+        }
+
+    async def run(self, articles, output_path):
+        """Process `articles` (any iterable), appending each result to `output_path` as it finishes.
+
+        At most 2 * concurrency articles are in flight, so memory does not grow with the corpus.
+        """
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # the shared client (and its connection pool) is sized for MAX_CONCURRENT_CALLS until told otherwise
+        cod.llm_client().set_concurrency(self.concurrency)
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency + EVALUATION_THREADS))
+        max_articles = 2 * self.concurrency
+        pending = set()
+        done_count = failed = 0
+        with JsonlCheckpointWriter(output_path) as out:
+
+            def write(task):
+                nonlocal done_count, failed
+                try:
+                    result = task.result()
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Article {task.get_name()} failed: {e}")
+                    return
+                out.write(result)
+                done_count += 1
+
+            for article in articles:
+                pending.add(asyncio.create_task(self.process_article(article), name=str(article["id"])))
+                if len(pending) >= max_articles:
+                    finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished:
+                        write(task)
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    write(task)
+        return {"done": done_count, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch chain-of-density summarization over a JSONL corpus.")
+    parser.add_argument("input", help='JSONL file with one {"id": ..., "text": ...} article per line')
+    parser.add_argument("--output", default="cod_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_CALLS)
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--metrics-json", default=cod.METRICS_JSON, help="per-stage latency / token / cost summary")
+    parser.add_argument("--metrics-prom", default=cod.METRICS_PROM, help="the same summary as a Prometheus text file")
+    parser.add_argument("--max-iterations", type=int, default=cod.MAX_DENSITY_ITERATIONS,
+                        help="upper bound on increase_density calls per article")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start = time.perf_counter()
+    articles = read_articles(args.input, skip=finished_ids(args.output))
+    cod.llm_client().max_retries = args.retries
+    runner = BatchRunner(concurrency=args.concurrency, max_iterations=args.max_iterations)
+    counts = asyncio.run(runner.run(articles, args.output))
+    elapsed = time.perf_counter() - start
+    logging.info(f"{counts['done']} articles summarized ({counts['failed']} failed) in {elapsed:.1f}s")
+    logging.info(f"Response cache: {cod.response_cache().stats()}")
+    metrics.write_json(args.metrics_json)
+    metrics.write_prometheus(args.metrics_prom)
+    logging.info(f"Metrics written to {args.metrics_json} and {args.metrics_prom}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from collections import deque
+
+
+def normalize_text(text, case_sensitive=False):
+    """Collapse runs of whitespace to one space and (by default) casefold, so "New  York" matches "new york"."""
+    text = " ".join(text.split())
+    return text if case_sensitive else text.casefold()
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton over a list of entities, built once and reused for many summaries.
+
+    Scanning a summary is a single pass over its characters no matter how many entities there are,
+    instead of one substring search per entity.
+
+    Args:
+    - entities (list): Entity strings (e.g. from extract_entities). Duplicates are allowed; blanks are ignored.
+    - case_sensitive (bool): Match case exactly (default False).
+    - word_boundary (bool): Only match whole words, so "Art" is not found inside "party" (default True).
+                            Entities that start / end with a non-word character (like "$200") are not
+                            boundary-checked on that side.
+    """
+
+    def __init__(self, entities, case_sensitive=False, word_boundary=True):
+        self.entities = list(entities)
+        self.case_sensitive = case_sensitive
+        self.word_boundary = word_boundary
+        # state -> {char: next state}, failure link and ids of the patterns that end in that state
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.patterns = []
+        # pattern id -> indices of the entities that normalize to that pattern
+        self.pattern_entities = []
+        pattern_ids = {}
+        for index, entity in enumerate(self.entities):
+            pattern = normalize_text(entity, case_sensitive)
+            if not pattern:
+                continue
+            if pattern not in pattern_ids:
+                pattern_ids[pattern] = len(self.patterns)
+                self.patterns.append(pattern)
+                self.pattern_entities.append([])
+                self._insert(pattern, pattern_ids[pattern])
+            self.pattern_entities[pattern_ids[pattern]].append(index)
+        self._build_failure_links()
+        # blank entities can never match, so they do not count towards the total either
+        self.num_entities = sum(len(indices) for indices in self.pattern_entities)
+
+    def _insert(self, pattern, pattern_id):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append(pattern_id)
+
+    def _build_failure_links(self):
+        # breadth-first, so the failure link of a state is always finished before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                # a state also reports every pattern that ends in its failure state
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def _boundary_ok(self, text, start, end, pattern):
+        if not self.word_boundary:
+            return True
+        if _is_word_char(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(pattern[-1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def find(self, text):
+        """Return the set of indices (into `entities`) of the entities that occur in `text`."""
+        text = normalize_text(text, self.case_sensitive)
+        found_patterns = set()
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for pattern_id in self.outputs[state]:
+                if pattern_id in found_patterns:
+                    continue
+                pattern = self.patterns[pattern_id]
+                start = position - len(pattern) + 1
+                if self._boundary_ok(text, start, position + 1, pattern):
+                    found_patterns.add(pattern_id)
+        return {index for pattern_id in found_patterns for index in self.pattern_entities[pattern_id]}
+
+    def score(self, summary):
+        """Entity coverage of one summary, in the same format evaluate_summaries() reports."""
+        total_entities = self.num_entities
+        count_entities = len(self.find(summary))
+        return {
+            "Entities in Text": total_entities,
+            "Matching Entities in Summary": count_entities,
+            "Score": count_entities / total_entities if total_entities else 0.0,
+        }
+
+    def score_batch(self, summaries):
+        """score() for many summaries against this entity set (the automaton is only built once)."""
+        return [self.score(summary) for summary in summaries]
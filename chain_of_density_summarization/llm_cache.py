@@ -0,0 +1,76 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+# "cache": serve recorded responses and record new ones (default)
+# "replay": only serve recorded responses, never call the API (raises CacheMiss instead)
+# "live": always call the API and do not touch the cache
+CACHE_MODES = ("cache", "replay", "live")
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def request_key(model, messages, temperature):
+    """Hash of everything that determines a (temperature 0) chat completion."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Persistent (SQLite) record of chat completion responses, keyed by request_key().
+
+    Since every call uses temperature 0, a recorded response can stand in for a new API call, which
+    avoids paying twice for the same prompt and lets the whole pipeline run offline in replay mode.
+    """
+
+    def __init__(self, path, mode="cache"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        if mode != "live":
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+            self.conn.commit()
+
+    def get(self, model, messages, temperature):
+        """Return the recorded response for this request, or None (CacheMiss in replay mode)."""
+        if self.mode == "live":
+            return None
+        key = request_key(model, messages, temperature)
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMiss(f"No recorded response for request {key} (replay mode)")
+            return None
+        return json.loads(row[0])
+
+    def put(self, model, messages, temperature, response):
+        if self.mode != "cache":
+            return
+        key = request_key(model, messages, temperature)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, json.dumps(response, ensure_ascii=False)),
+            )
+            self.conn.commit()
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
@@ -1,5 +1,36 @@
+import ast
+import os
+import sys
+import threading
+import time
+
 import numpy as np
-import openai
+
+# llm_client.py lives at the repository root and is shared with create_data/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_matcher import EntityMatcher
+from instrumentation import add, instrument, metrics
+from llm_client import LLAMA_STUB_URL, LLMClient, OpenAICompatibleBackend, get_client
+from llm_cache import ResponseCache
+from ngram_overlap import NgramOverlapScorer
+
+# Responses are recorded here; set COD_CACHE_MODE=replay to run everything offline from the recordings
+# (or COD_CACHE_MODE=live to bypass the cache)
+CACHE_PATH = os.environ.get("COD_CACHE_PATH", "llm_responses.sqlite3")
+CACHE_MODE = os.environ.get("COD_CACHE_MODE", "cache")
+TEMPERATURE = 0  # set to 0 for reproducibility, which is also what makes caching responses safe
+# "openai", or "llama" for an OpenAI-compatible local server (python llm_stub_server.py for offline load tests)
+LLM_BACKEND = os.environ.get("COD_LLM_BACKEND", "openai")
+MAX_CONCURRENT_CALLS = 8
+METRICS_JSON = "cod_metrics.json" # per-stage latency / token / cost summary, written at the end of a run
+METRICS_PROM = "cod_metrics.prom" # the same numbers as a Prometheus text file
+MAX_DENSITY_ITERATIONS = 5 # upper bound for densify(); it usually stops earlier, once a rewrite stops adding entities
+LENGTH_TOLERANCE = 1.1 # densify() keeps rewrites up to 10% over the target length; models rarely hit an exact character count
+TOKENS_PER_MINUTE = 90000
+_response_cache = None
+_response_cache_lock = threading.Lock()
+ngram_scorer = NgramOverlapScorer() # second, LLM-free evaluator used by evaluate_summaries
 
 
 class LLMAgent(object):
@@ -8,9 +39,14 @@ class LLMAgent(object):
         self.llm = None
         self.key = None
         self.model = None
+        self.org_id = None
+        self.base_url = None
 
+    # points at a local OpenAI-compatible server (LLAMA_BASE_URL, llm_stub_server.py by default) instead of OpenAI
     def create_llama_agent(self):
         self.llm = "llama"
+        self.model = "llama-2-7b-chat"
+        self.base_url = LLAMA_STUB_URL
 
     # the object variables used here will be used as arguments later for authenticating my OpenAI API calls
     def create_openai_agent(self):
@@ -18,24 +54,66 @@ class LLMAgent(object):
         self.key = "<REPLACE WITH OPENAI API KEY>"
         self.model = "gpt-3.5-turbo"
         self.org_id = "<REPLACE WITH OPENAI ORGANIZATION ID>"
+        self.base_url = "https://api.openai.com/v1"
+
+
+def create_agent(llm=LLM_BACKEND):
+    agent = LLMAgent()
+    if llm == "llama":
+        agent.create_llama_agent()
+    else:
+        agent.create_openai_agent()
+    return agent
+
+
+agent = create_agent() # created once; every call shares its client and connection pool
+
+
+def llm_client():
+    """The process-wide client for `agent` (pooled connections, retries with backoff, concurrency / token-rate limits)."""
+    return get_client(agent.llm, lambda: LLMClient(
+        OpenAICompatibleBackend(agent.base_url, agent.model, api_key=agent.key, organization=agent.org_id,
+                                pool_size=MAX_CONCURRENT_CALLS),
+        max_concurrency=MAX_CONCURRENT_CALLS,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+    ))
+
 
+def response_cache():
+    """The process-wide ResponseCache, opened on first use (so importing this module does not create CACHE_PATH)."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(CACHE_PATH, mode=CACHE_MODE)
+        return _response_cache
+
+
+@instrument()
 def call_LLM_model(msgs):
     """My own helper function that can be called with an input of "msgs", which should include the prompts needed for the specific call.
     
-    Note that I chose to use the OpenAI model for this assignment, so I did not implement the llama model call.
+    The OpenAI model is used by default; set COD_LLM_BACKEND=llama to send the same requests to a local
+    OpenAI-compatible server instead (see create_llama_agent).
+
+    Responses are looked up in (and recorded to) `response_cache()` first, keyed by (model, messages, temperature),
+    so a repeated prompt never costs a second API call. In replay mode a prompt that was never recorded raises CacheMiss.
+
+    Every call is recorded by instrumentation.py under the stage of the function that made it (e.g. "entity_extraction").
 
     """
-    agent = LLMAgent()
-    agent.create_openai_agent()
-    openai.organization = agent.org_id
-    openai.api_key = agent.key
-    response = openai.ChatCompletion.create(
-        model=agent.model,
-        messages = msgs, # list of dicts containing system and user prompts defined by different function use cases respectively
-        temperature = 0 # set to 0 for reproducibility
+    cached = response_cache().get(agent.model, msgs, TEMPERATURE)
+    if cached is not None:
+        add(cache_hits=1)
+        return cached
+    add(cache_misses=1)
+    response = llm_client().chat(
+        msgs, # list of dicts containing system and user prompts defined by different function use cases respectively
+        temperature = TEMPERATURE
     )
+    response_cache().put(agent.model, msgs, TEMPERATURE, response)
     return response
 
+@instrument("base_summary")
 def base_summary(text):
     """Generate an initial entity-sparse summary of the given text.
 
@@ -55,6 +133,7 @@ def base_summary(text):
     return summary
 
 
+@instrument("entity_extraction")
 def extract_entities(text):
     """Extract and rank entities from the given text.
 
@@ -70,13 +149,29 @@ def extract_entities(text):
         {"role": "user", "content": user_message}
     ]
     response = call_LLM_model(messages)
-    # Even though I have asked the model to return a Python list, I will still receive it as a string, so the below code
-    # takes the string, removes the heading and trailing square brackets, removes the single apostrophes, and uses
-    # the split function to separate the string into a list of strings.
-    entities = response['choices'][0]['message']['content'].strip('][').replace("'", "").split(", ")
+    entities = parse_entity_list(response['choices'][0]['message']['content'])
     return entities
 
-def increase_density(summary, entities, target_length):
+
+def parse_entity_list(content):
+    """Turn the model's "Python list" answer into a list of entity strings.
+
+    The answer is parsed as a Python literal when possible, so entities containing apostrophes or commas
+    (e.g. "Bud's RV", "Seattle, Washington") survive. Otherwise fall back to the original approach: take the
+    string, remove the heading and trailing square brackets, remove the single apostrophes, and split on ", ".
+    """
+    content = content.strip()
+    try:
+        parsed = ast.literal_eval(content)
+    except (ValueError, SyntaxError):
+        parsed = None
+    if isinstance(parsed, (list, tuple)):
+        entities = [str(entity).strip() for entity in parsed]
+    else:
+        entities = content.strip('][').replace("'", "").split(", ")
+    return [entity for entity in entities if entity]
+
+def increase_density(summary, entities, target_length, missing_only=False):
     """Iteratively incorporate missing entities into the summary without
     increasing its length, using abstraction, fusion, and compression techniques.
 
@@ -84,19 +179,111 @@ def increase_density(summary, entities, target_length):
     - summary (str): The initial summary.
     - entities (list): List of entities to be incorporated into the summary.
     - target_length (int): The desired length of the final summary.
+    - missing_only (bool): `entities` only holds the entities that are missing from the summary (see densify),
+                           so the prompt asks to add exactly those instead of comparing against the full list.
 
     Returns:
     - str: The final summary with increased density.
     """
-    user_message = f"Utilizing abstraction, fusion, and compression techniques, rewrite the given summary to incorporate any entities found in the provided Python list that are missing from the summary. Make sure that the summary you write is at most {target_length} characters long, which is the length of the original summary. Also make sure that any entities that are already present do not disappear in your new summary. Entity list: {entities}. Summary: {summary}."
+    response = increase_density_response(summary, entities, target_length, missing_only)
+    dense_summary = response['choices'][0]['message']['content'].strip()
+    return dense_summary  
+
+
+@instrument("densification")
+def increase_density_response(summary, entities, target_length, missing_only=False, previous_length=None):
+    """Same as increase_density, but returns the whole response (including 'usage', the token counts).
+
+    `previous_length` is the length of an earlier rewrite that came out too long; the prompt then asks again more strictly.
+    """
+    if missing_only:
+        user_message = f"Utilizing abstraction, fusion, and compression techniques, rewrite the given summary to also incorporate the entities in the provided Python list, which are all missing from the summary. Make sure that the summary you write is at most {target_length} characters long, which is the length of the original summary. Also make sure that any entities that are already present do not disappear in your new summary. Missing entities: {entities}. Summary: {summary}."
+    else:
+        user_message = f"Utilizing abstraction, fusion, and compression techniques, rewrite the given summary to incorporate any entities found in the provided Python list that are missing from the summary. Make sure that the summary you write is at most {target_length} characters long, which is the length of the original summary. Also make sure that any entities that are already present do not disappear in your new summary. Entity list: {entities}. Summary: {summary}."
+    if previous_length is not None:
+        user_message += f" Your previous rewrite was {previous_length} characters long, which is too long. The new summary must not be longer than {target_length} characters: compress more, and leave out the least important entities if they do not fit."
     messages = [
         {"role": "system", "content": "You are a helpful assistant that is an expert on using abstraction, fusion, and compression techniques to increase entity densities of summaries given to you."},
         {"role": "user", "content": user_message}
     ]
-    response = call_LLM_model(messages)
-    dense_summary = response['choices'][0]['message']['content'].strip()
-    return dense_summary  
+    return call_LLM_model(messages)
+
 
+# Helper function to measure a summary: entity coverage, entities per word and which entities are still missing
+def _density_stats(matcher, summary):
+    found = matcher.find(summary)
+    num_words = len(summary.split())
+    return {
+        "coverage": len(found) / matcher.num_entities if matcher.num_entities else 0.0,
+        "density": len(found) / num_words if num_words else 0.0,
+        "length": len(summary),
+        "missing": [entity for index, entity in enumerate(matcher.entities) if index not in found and entity.strip()],
+    }
+
+
+def densify(summary, entities, target_length, max_iterations=MAX_DENSITY_ITERATIONS):
+    """Adaptive version of calling increase_density a fixed number of times.
+
+    After every rewrite the missing entities are found locally (EntityMatcher, no LLM call), and only those
+    are sent in the next prompt. The loop stops as soon as:
+    - every entity is in the summary ("all entities covered"),
+    - a rewrite is more than LENGTH_TOLERANCE times `target_length` long, and so is the one retry with a stricter
+      prompt ("over length budget"; neither is kept, earlier rewrites are),
+    - a rewrite neither covers more entities nor packs the same entities into fewer words ("no improvement";
+      the rewrite is not kept),
+    - or `max_iterations` rewrites were made ("max iterations").
+
+    Args:
+    - summary (str): The initial (entity-sparse) summary.
+    - entities (list): Entities from extract_entities.
+    - target_length (int): Length in characters asked for in every rewrite (usually the initial summary's length).
+    - max_iterations (int): Maximum number of increase_density calls.
+
+    Returns:
+    - list: The kept summaries, starting with `summary`; the last one is the final summary.
+    - list: One dict per iteration (iteration 0 is the input summary) with "coverage", "density", "length",
+            "missing", "prompt_tokens", "completion_tokens", "seconds" and "kept", plus "stop_reason" on the last one.
+    """
+    matcher = EntityMatcher(entities)
+    best = _density_stats(matcher, summary)
+    summaries = [summary]
+    history = [dict(best, iteration=0, prompt_tokens=0, completion_tokens=0, seconds=0.0, kept=True)]
+    stop_reason = "max iterations"
+    max_length = int(target_length * LENGTH_TOLERANCE)
+    retried = False
+    for iteration in range(1, max_iterations + 1):
+        if not best["missing"]:
+            stop_reason = "all entities covered"
+            break
+        previous_length = history[-1]["length"] if retried else None
+        start = time.perf_counter()
+        response = increase_density_response(summaries[-1], best["missing"], target_length, missing_only=True,
+                                             previous_length=previous_length)
+        seconds = time.perf_counter() - start
+        candidate = response['choices'][0]['message']['content'].strip()
+        stats = _density_stats(matcher, candidate)
+        usage = response.get('usage') or {}
+        step = dict(stats, iteration=iteration, prompt_tokens=usage.get('prompt_tokens', 0),
+                    completion_tokens=usage.get('completion_tokens', 0), seconds=seconds, kept=False)
+        history.append(step)
+        if stats["length"] > max_length:
+            if retried:
+                stop_reason = "over length budget"
+                break
+            retried = True  # ask once more with a stricter prompt before giving up
+            continue
+        retried = False
+        improved = stats["coverage"] > best["coverage"] or (stats["coverage"] == best["coverage"] and stats["density"] > best["density"])
+        if not improved:
+            stop_reason = "no improvement"
+            break
+        step["kept"] = True
+        summaries.append(candidate)
+        best = stats
+    history[-1]["stop_reason"] = stop_reason
+    return summaries, history
+
+@instrument("one_step_summary")
 def dense_summary(text):
     """Produces a dense summary in a single step without iteration.
     """
@@ -115,15 +302,17 @@ def dense_summary(text):
     return one_step_summary
 
 
-def evaluate_summaries(summaries):
+def evaluate_summaries(summaries, known_entities=None):
     """Compare the given summaries and possibly human-written summaries.
 
     Args:
     - summaries (dict): A dictionary of dictionaries, each containing a "text" and "summary" key. The "text" value contains the original text
                         to get the list of entities. The "summary" value contains the summary.
+    - known_entities (dict): Optional mapping of text -> entities that were already extracted, so they are not extracted again.
 
     Returns:
-    - dict: A dictionary containing evaluation metrics for each summary.
+    - dict: A dictionary containing evaluation metrics for each summary: the entity score, plus the n-gram overlap
+            with the source text for n = 1..4 under 'N-gram Overlap' (see ngram_overlap.py).
 
     ********IMPORTANT*********
     Alternative evalution method: One alternative method of evaluating these summaries is by measuring the "n-gram" overlap between summaries
@@ -142,21 +331,25 @@ def evaluate_summaries(summaries):
     combination possible in each text/summary. A simple score to calculate would be to divide the total number of matching n-grams by the total number 
     of n-grams in the source text (which presumably has more n-grams than the summary).
 
+    This alternative is now computed alongside the entity score: NgramOverlapScorer reports that score as "recall"
+    (with distinct n-grams), together with precision and F1, for n = 1..4.
+
     """
     results = {}
+    entities_by_text = dict(known_entities or {}) # summaries usually share one source text, so extract its entities only once
+    matchers = {} # one Aho-Corasick automaton per source text, reused for every summary of that text
     for key in summaries.keys():
         summary = summaries[key]['summary']
-        text_entities = extract_entities(summaries[key]['text']) # calls extract_entities to get list of entities present in original text
-        total_entities = len(text_entities) # count total number of entities extracted
-        count_entities = 0
-
-        # increments count of entities found in summary if entity is present
-        for i in range(total_entities):
-            if text_entities[i] in summary:
-                count_entities += 1
-        
-        # for each summary, returns 1) total number of entities extracted from original text, 2) number of extracted entities found in summary, and 3) score calculated by dividing 2 by 1.
-        result = {'Entities in Text': total_entities, 'Matching Entities in Summary': count_entities, 'Score': count_entities/total_entities}
+        text = summaries[key]['text']
+        if text not in matchers:
+            if text not in entities_by_text:
+                entities_by_text[text] = extract_entities(text) # calls extract_entities to get list of entities present in original text
+            matchers[text] = EntityMatcher(entities_by_text[text])
+
+        # for each summary, returns 1) total number of entities extracted from original text, 2) number of extracted entities found in summary
+        # (case-insensitive, whole words, found in a single pass over the summary), and 3) score calculated by dividing 2 by 1.
+        result = matchers[text].score(summary)
+        result['N-gram Overlap'] = ngram_scorer.score(summary, text)
         results[key] = result
     return results
 
@@ -172,28 +365,34 @@ if __name__ == "__main__":
     # Step 2: Extract entities from the original text with extract_entities()
     entities = extract_entities(text)
 
-    # Step 3: Call increase_density 3 times, using the returned summary in the next call
-    first_iter = increase_density(initial_summary, entities, len(initial_summary))
-    second_iter = increase_density(first_iter, entities, len(first_iter))
-    final_summary = increase_density(second_iter, entities, len(second_iter))
+    # Step 3: Densify the initial summary, sending only the still-missing entities each time and stopping once it stops improving
+    iterations, density_history = densify(initial_summary, entities, len(initial_summary))
+    final_summary = iterations[-1]
 
     # Step 3.5: Generate entity-dense summary with one step function (for extra credit)
     one_step_summary = dense_summary(text)
 
     # Step 4: Put each summary into dictionaries with original text
-    init_sum = {'text': text, 'summary': initial_summary}
-    first_sum = {'text': text, 'summary': first_iter}
-    second_sum = {'text': text, 'summary': second_iter}
-    final_sum = {'text': text, 'summary': final_summary}
-    one_step_sum = {'text': text, 'summary': one_step_summary}
+    summaries = {"initial": {'text': text, 'summary': initial_summary}}
+    for i, summary in enumerate(iterations[1:-1], start=1):
+        summaries[f"iteration {i}"] = {'text': text, 'summary': summary}
+    summaries["final"] = {'text': text, 'summary': final_summary}
+    summaries["one step"] = {'text': text, 'summary': one_step_summary}
 
     # Step 5: Print final and one-step summaries out to compare qualitatively
     print("Final Summary:")
     print(final_summary)
     print("One-Step Summary:")
     print(one_step_summary)
+    for step in density_history:
+        print(f"Iteration {step['iteration']}: coverage {step['coverage']:.2f}, density {step['density']:.3f}, "
+              f"{step['prompt_tokens']} prompt tokens, {step['seconds']:.2f}s{'' if step['kept'] else ' (discarded)'}")
+    print("Stopped:", density_history[-1]["stop_reason"])
 
-    # Step 6: Aggregate all dictionaries into one dictionary and pass that into evalute_summaries for summarization evaluation
-    summaries = {"initial": init_sum, "first": first_sum, "second": second_sum, "final": final_sum, "one step": one_step_sum}
-    results = evaluate_summaries(summaries)
+    # Step 6: Pass the dictionary of all summaries into evalute_summaries for summarization evaluation
+    results = evaluate_summaries(summaries, known_entities={text: entities})
     print(results)
+    print("Response cache:", response_cache().stats())
+    metrics.write_json(METRICS_JSON)
+    metrics.write_prometheus(METRICS_PROM)
+    print(f"Metrics written to {METRICS_JSON} and {METRICS_PROM}")
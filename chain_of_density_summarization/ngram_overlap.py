@@ -0,0 +1,95 @@
+import hashlib
+import re
+import threading
+
+import numpy as np
+
+MAX_N = 4
+MAX_CACHED_SOURCES = 1024
+TOKEN = re.compile(r"\w+")
+NGRAM_BASE = np.uint64(0x100000001B3)
+
+
+class NgramOverlapScorer:
+    """N-gram overlap between summaries and their source texts (the alternative metric described in
+    evaluate_summaries()), computed without any LLM calls.
+
+    Each text is tokenized once, every token is mapped to a 64-bit id, and the n-grams of a text are hashed
+    together as a polynomial over those ids with NumPy, giving one sorted array of unique n-gram hashes per n.
+    The overlap of a summary and its source is then a set intersection of two sorted arrays. Source texts are
+    kept in a small cache, so scoring many summaries (e.g. every increase_density iteration) against the same
+    source only processes the source once. Both caches are guarded by a lock, so one scorer can be shared by
+    threads (batch_cod.py evaluates articles in worker threads).
+
+    For every n in 1..max_n the scores are:
+    - "matches": number of distinct summary n-grams that also occur in the source
+    - "precision": matches / distinct summary n-grams (how much of the summary is grounded in the source)
+    - "recall": matches / distinct source n-grams (the score described in evaluate_summaries())
+    - "f1": harmonic mean of precision and recall
+    """
+
+    def __init__(self, max_n=MAX_N, max_cached_sources=MAX_CACHED_SOURCES):
+        self.max_n = max_n
+        self.max_cached_sources = max_cached_sources
+        self.token_ids = {}
+        self.source_cache = {}
+        self.lock = threading.Lock()
+
+    def _ids(self, text):
+        ids = []
+        tokens = TOKEN.findall(text.lower())
+        with self.lock:
+            for token in tokens:
+                token_id = self.token_ids.get(token)
+                if token_id is None:
+                    token_id = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+                    self.token_ids[token] = token_id
+                ids.append(token_id)
+        return np.array(ids, dtype=np.uint64)
+
+    def ngram_hashes(self, text):
+        """Return [sorted unique 1-gram hashes, ..., sorted unique max_n-gram hashes] for `text`."""
+        ids = self._ids(text)
+        hashes = []
+        with np.errstate(over="ignore"):
+            for n in range(1, self.max_n + 1):
+                count = len(ids) - n + 1
+                if count <= 0:
+                    hashes.append(np.zeros(0, dtype=np.uint64))
+                    continue
+                ngrams = ids[:count].copy()
+                for j in range(1, n):
+                    ngrams = ngrams * NGRAM_BASE + ids[j:j + count]
+                hashes.append(np.unique(ngrams))
+        return hashes
+
+    def _source_hashes(self, source):
+        with self.lock:
+            hashes = self.source_cache.get(source)
+        if hashes is None:
+            # hashed outside the lock; two threads may both hash a new source, which only costs time
+            hashes = self.ngram_hashes(source)
+            with self.lock:
+                if source not in self.source_cache:
+                    if len(self.source_cache) >= self.max_cached_sources:
+                        # drop the oldest source (dicts keep insertion order)
+                        del self.source_cache[next(iter(self.source_cache))]
+                    self.source_cache[source] = hashes
+        return hashes
+
+    def score(self, summary, source):
+        """Return {n: {"matches", "precision", "recall", "f1"}} for n = 1..max_n."""
+        summary_hashes = self.ngram_hashes(summary)
+        source_hashes = self._source_hashes(source)
+        scores = {}
+        for n, (summary_ngrams, source_ngrams) in enumerate(zip(summary_hashes, source_hashes), start=1):
+            matches = np.intersect1d(summary_ngrams, source_ngrams, assume_unique=True).size
+            precision = matches / summary_ngrams.size if summary_ngrams.size else 0.0
+            recall = matches / source_ngrams.size if source_ngrams.size else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if matches else 0.0
+            scores[n] = {"matches": int(matches), "precision": precision, "recall": recall, "f1": f1}
+        return scores
+
+    def score_batch(self, summaries, sources):
+        """score() for many (summary, source) pairs; repeated sources are only tokenized and hashed once."""
+        return [self.score(summary, source) for summary, source in zip(summaries, sources)]
@@ -0,0 +1,84 @@
+import pytest
+
+import main as cod
+
+ENTITIES = ["Anna Erickson", "Seattle", "Bud Dodson", "Starbucks"]
+SUMMARY = "A photographer met RV dwellers living in Seattle."  # covers 1 of 4 entities
+
+
+def scripted_rewrites(monkeypatch, *rewrites):
+    """Make increase_density_response answer with `rewrites` in order; return the list of calls it got."""
+    calls = []
+
+    def increase_density_response(summary, entities, target_length, missing_only=False, previous_length=None):
+        calls.append({"summary": summary, "entities": entities, "previous_length": previous_length})
+        return {"choices": [{"message": {"content": rewrites[len(calls) - 1]}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+    monkeypatch.setattr(cod, "increase_density_response", increase_density_response)
+    return calls
+
+
+def test_stops_once_every_entity_is_covered(monkeypatch):
+    calls = scripted_rewrites(monkeypatch, "Anna Erickson met Seattle RV dwellers.",
+                              "Anna Erickson met Bud Dodson in Seattle by Starbucks.")
+    summaries, history = cod.densify(SUMMARY, ENTITIES, len(SUMMARY) + 10)
+    assert summaries[1:] == ["Anna Erickson met Seattle RV dwellers.", "Anna Erickson met Bud Dodson in Seattle by Starbucks."]
+    assert history[-1]["stop_reason"] == "all entities covered"
+    # only the entities still missing are sent each time
+    assert calls[0]["entities"] == ["Anna Erickson", "Bud Dodson", "Starbucks"]
+    assert calls[1]["entities"] == ["Bud Dodson", "Starbucks"]
+    assert [step["coverage"] for step in history] == [0.25, 0.5, 1.0]
+
+
+def test_stops_when_a_rewrite_does_not_improve(monkeypatch):
+    scripted_rewrites(monkeypatch, "RV dwellers live in Seattle, a photographer found.")
+    summaries, history = cod.densify(SUMMARY, ENTITIES, len(SUMMARY))
+    assert summaries == [SUMMARY]
+    assert history[-1]["stop_reason"] == "no improvement"
+    assert history[-1]["kept"] is False
+
+
+def test_stops_after_max_iterations(monkeypatch):
+    scripted_rewrites(monkeypatch, "Seattle: Anna Erickson.", "Seattle: Anna Erickson, Starbucks.")
+    summaries, history = cod.densify(SUMMARY, ENTITIES, len(SUMMARY), max_iterations=2)
+    assert len(summaries) == 3
+    assert history[-1]["stop_reason"] == "max iterations"
+
+
+def test_rewrites_within_the_length_tolerance_are_kept(monkeypatch):
+    target = 50
+    rewrite = "Anna Erickson met RV dwellers in Seattle this week."  # 51 characters, within 10%
+    assert target < len(rewrite) <= target * cod.LENGTH_TOLERANCE
+    scripted_rewrites(monkeypatch, rewrite, rewrite)
+    summaries, history = cod.densify(SUMMARY, ENTITIES, target)
+    assert summaries[-1] == rewrite
+    assert history[1]["kept"] is True
+
+
+def test_too_long_rewrite_is_retried_once_with_a_stricter_prompt(monkeypatch):
+    too_long = "Anna Erickson " + "x" * 100 + " Seattle."
+    calls = scripted_rewrites(monkeypatch, too_long, "Anna Erickson met Seattle RV dwellers.",
+                              "Anna Erickson met Bud Dodson in Seattle by Starbucks.")
+    summaries, history = cod.densify(SUMMARY, ENTITIES, len(SUMMARY))
+    assert [call["previous_length"] for call in calls] == [None, len(too_long), None]
+    assert calls[1]["summary"] == SUMMARY  # the retry rewrites the same summary
+    assert [step["kept"] for step in history] == [True, False, True, True]
+    assert history[-1]["stop_reason"] == "all entities covered"
+
+
+def test_stops_when_the_retry_is_too_long_too(monkeypatch):
+    too_long = "Anna Erickson " + "x" * 100 + " Seattle."
+    calls = scripted_rewrites(monkeypatch, "Anna Erickson met Seattle RV dwellers.", too_long, too_long)
+    summaries, history = cod.densify(SUMMARY, ENTITIES, len(SUMMARY))
+    assert summaries[1:] == ["Anna Erickson met Seattle RV dwellers."]  # earlier rewrites are kept
+    assert len(calls) == 3
+    assert history[-1]["stop_reason"] == "over length budget"
+
+
+@pytest.mark.parametrize("entities", [[], ["Seattle"]])
+def test_nothing_to_add_makes_no_call(monkeypatch, entities):
+    calls = scripted_rewrites(monkeypatch)
+    summaries, history = cod.densify(SUMMARY, entities, len(SUMMARY))
+    assert (summaries, calls) == ([SUMMARY], [])
+    assert history[-1]["stop_reason"] == "all entities covered"
@@ -0,0 +1,57 @@
+import random
+import re
+
+import pytest
+
+from entity_matcher import EntityMatcher, normalize_text
+
+ENTITIES = ["New York", "York", "New York City", "Art", "art gallery", "$200", "U.S.", "Bud's RV", "SoDo",
+            "a", "Seattle, Washington", "", "  ", "new   york"]
+WORDS = ["new", "York", "city", "art", "party", "gallery", "$200", "$2000", "U.S.", "U.S.A", "Bud's", "RV", "RVs",
+         "sodo", "SoDo's", "a", "an", "Seattle,", "Washington", "_York", "York_", "newyork", ".", ",", "-"]
+
+
+def regex_find(entities, text, case_sensitive=False, word_boundary=True):
+    """Reference implementation: one regex search per entity."""
+    text = normalize_text(text, case_sensitive)
+    found = set()
+    for index, entity in enumerate(entities):
+        pattern = normalize_text(entity, case_sensitive)
+        if not pattern:
+            continue
+        regex = re.escape(pattern)
+        if word_boundary and re.match(r"\w", pattern[0]):
+            regex = r"(?<!\w)" + regex
+        if word_boundary and re.match(r"\w", pattern[-1]):
+            regex = regex + r"(?!\w)"
+        if re.search(regex, text):
+            found.add(index)
+    return found
+
+
+@pytest.mark.parametrize("case_sensitive", [False, True])
+@pytest.mark.parametrize("word_boundary", [True, False])
+def test_find_matches_regex_reference(case_sensitive, word_boundary):
+    rng = random.Random(584)
+    matcher = EntityMatcher(ENTITIES, case_sensitive=case_sensitive, word_boundary=word_boundary)
+    for _ in range(2000):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12)))
+        assert matcher.find(text) == regex_find(ENTITIES, text, case_sensitive, word_boundary), text
+
+
+def test_word_boundaries():
+    matcher = EntityMatcher(["Art", "$200", "York"])
+    assert matcher.find("a party at the gallery") == set()
+    assert matcher.find("Art, then more art") == {0}
+    assert matcher.find("it cost $2000") == set()  # "$200" ends with a word character, so it is boundary-checked there
+    assert matcher.find("it cost us$200.") == {1}  # but not before its leading "$"
+    assert matcher.find("New-York") == {2}
+    assert matcher.find("NewYork") == set()
+
+
+def test_score_ignores_blank_entities():
+    matcher = EntityMatcher(["Seattle", "", "SoDo", "seattle"])
+    assert matcher.num_entities == 3
+    assert matcher.score("Seattle's SoDo") == {"Entities in Text": 3, "Matching Entities in Summary": 3, "Score": 1.0}
+    assert matcher.score("nothing") == {"Entities in Text": 3, "Matching Entities in Summary": 0, "Score": 0.0}
+    assert EntityMatcher([]).score("anything")["Score"] == 0.0
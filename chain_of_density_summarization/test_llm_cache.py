@@ -0,0 +1,55 @@
+import pytest
+
+import main as cod
+from llm_cache import CacheMiss, ResponseCache, request_key
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Summarize: text"}]
+RESPONSE = {"choices": [{"message": {"role": "assistant", "content": "A summary."}}], "usage": {"prompt_tokens": 5}}
+
+
+def test_request_key_covers_model_messages_and_temperature():
+    key = request_key("model", MESSAGES, 0)
+    assert request_key("model", [dict(message) for message in MESSAGES], 0) == key
+    assert request_key("other model", MESSAGES, 0) != key
+    assert request_key("model", MESSAGES[1:], 0) != key
+    assert request_key("model", MESSAGES, 0.7) != key
+
+
+def test_recorded_responses_are_replayed(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    recorder = ResponseCache(path)
+    assert recorder.get("model", MESSAGES, 0) is None
+    recorder.put("model", MESSAGES, 0, RESPONSE)
+    assert recorder.get("model", MESSAGES, 0) == RESPONSE
+    assert recorder.stats() == {"mode": "cache", "hits": 1, "misses": 1}
+
+    replay = ResponseCache(path, mode="replay")
+    assert replay.get("model", MESSAGES, 0) == RESPONSE
+    with pytest.raises(CacheMiss):
+        replay.get("model", MESSAGES, 0.7)
+    replay.put("model", MESSAGES, 0.7, RESPONSE)  # replay never records
+    with pytest.raises(CacheMiss):
+        replay.get("model", MESSAGES, 0.7)
+
+
+def test_live_mode_does_not_touch_the_cache(tmp_path):
+    live = ResponseCache(str(tmp_path / "responses.sqlite3"), mode="live")
+    live.put("model", MESSAGES, 0, RESPONSE)
+    assert live.get("model", MESSAGES, 0) is None
+    assert not (tmp_path / "responses.sqlite3").exists()
+
+
+def test_unknown_mode_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path / "responses.sqlite3"), mode="offline")
+
+
+def test_replay_miss_never_reaches_the_api(tmp_path, monkeypatch):
+    monkeypatch.setattr(cod, "_response_cache", ResponseCache(str(tmp_path / "responses.sqlite3"), mode="replay"))
+
+    def no_api_calls():
+        raise AssertionError("replay mode called the API")
+
+    monkeypatch.setattr(cod, "llm_client", no_api_calls)
+    with pytest.raises(CacheMiss):
+        cod.base_summary("An article that was never recorded.")
@@ -0,0 +1,57 @@
+import random
+import re
+
+import pytest
+
+from ngram_overlap import NgramOverlapScorer
+
+VOCABULARY = ["the", "cat", "sat", "on", "mat", "The", "CAT", "dog", "ran", "home", "it's", "don't", "café", "42"]
+
+
+def brute_force(summary, source, max_n):
+    """Reference implementation: sets of word n-gram tuples."""
+    def ngrams(text, n):
+        words = re.findall(r"\w+", text.lower())
+        return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+    scores = {}
+    for n in range(1, max_n + 1):
+        summary_ngrams, source_ngrams = ngrams(summary, n), ngrams(source, n)
+        matches = len(summary_ngrams & source_ngrams)
+        precision = matches / len(summary_ngrams) if summary_ngrams else 0.0
+        recall = matches / len(source_ngrams) if source_ngrams else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if matches else 0.0
+        scores[n] = {"matches": matches, "precision": precision, "recall": recall, "f1": f1}
+    return scores
+
+
+def random_text(rng, max_words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(0, max_words)))
+
+
+@pytest.mark.parametrize("max_n", [1, 2, 4])
+def test_score_matches_brute_force(max_n):
+    rng = random.Random(584)
+    # a small source cache, so evicted sources are rehashed along the way
+    scorer = NgramOverlapScorer(max_n=max_n, max_cached_sources=3)
+    sources = [random_text(rng, 60) for _ in range(8)]
+    for _ in range(500):
+        summary = random_text(rng, 20)
+        source = rng.choice(sources)
+        scores, expected = scorer.score(summary, source), brute_force(summary, source, max_n)
+        assert scores.keys() == expected.keys()
+        for n in expected:
+            assert scores[n] == pytest.approx(expected[n]), (n, summary, source)
+
+
+def test_score_batch_matches_score():
+    scorer = NgramOverlapScorer()
+    summaries = ["the cat sat", "a dog ran home", ""]
+    sources = ["the cat sat on the mat", "the cat sat on the mat", "the dog ran home"]
+    assert scorer.score_batch(summaries, sources) == [scorer.score(s, t) for s, t in zip(summaries, sources)]
+    assert len(scorer.source_cache) == 2
+
+
+def test_identical_texts_score_one():
+    scores = NgramOverlapScorer().score("the cat sat on the mat", "The cat sat on the mat.")
+    assert all(scores[n]["precision"] == scores[n]["recall"] == scores[n]["f1"] == 1.0 for n in scores)
@@ -0,0 +1,89 @@
+"""Append-only JSONL output shared by create_data/ and chain_of_density_summarization/.
+
+Both pipelines write one record per line as results finish. After a crash, the next run reads back
+whatever parses (read_records) and appends after the last complete line (JsonlCheckpointWriter).
+"""
+import json
+import os
+
+CHECKPOINT_EVERY = 10  # fsync after this many records
+READ_BLOCK_SIZE = 64 * 1024  # bytes read at a time when looking for the last complete line
+
+
+class JsonlCheckpointWriter:
+    """Appends one JSON record per line and fsyncs every `fsync_every` records.
+
+    Every record is flushed to the OS as soon as it is written, and the periodic fsync makes sure
+    the data is on disk too, so a crash loses at most the records written since the last checkpoint.
+    """
+
+    def __init__(self, path, fsync_every=CHECKPOINT_EVERY):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.count = 0
+        _drop_partial_line(path)
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+        self.count += 1
+        if self.count % self.fsync_every == 0:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Helper function to cut off a half-written last line left behind by a crash, so appends stay valid JSONL.
+# Only the tail is read, block by block from the end, so memory does not grow with the size of the file.
+def _drop_partial_line(path, block_size=READ_BLOCK_SIZE):
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)  # no complete line at all
+
+
+def read_records(path):
+    """Yield the records of a JSONL file one at a time (skipping lines that do not parse)."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def completed_indices(paths, seed):
+    """Return the set of conversation indices already written for `seed` in any of `paths`."""
+    done = set()
+    for path in paths:
+        for record in read_records(path):
+            if record.get("seed") == seed:
+                done.add(record["idx"])
+    return done
@@ -0,0 +1,55 @@
+"""Micro-benchmark: the old remove_extra_spaces / truncate_conversation helpers vs normalizer.py.
+
+Usage: python bench_normalizer.py [--repeat 5] [--padding 0]
+
+Runs both over every line of new_data/*.txt. `--padding N` also pads every space with N extra
+spaces to mimic whitespace-heavy model output, where the repeated str.replace passes add up.
+"""
+import argparse
+import glob
+import os
+import timeit
+
+from normalizer import load_conversations, normalize_batch
+
+DATA_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "new_data", "*.txt")
+
+
+# The helpers data_creation.py used before normalizer.py, kept here as the baseline
+def legacy_remove_extra_spaces(conversation):
+    while "  " in conversation:
+        conversation = conversation.replace("  ", " ")
+    return conversation
+
+
+def legacy_truncate_conversation(conversation):
+    punctuation = [".", "!", "?"]
+    for i in range(len(conversation) - 1, -1, -1):
+        if conversation[i] in punctuation:
+            return conversation[: i + 1]
+    return conversation
+
+
+def legacy_batch(conversations):
+    return [legacy_truncate_conversation(legacy_remove_extra_spaces(conv)) for conv in conversations]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--padding", type=int, default=0)
+    args = parser.parse_args()
+
+    conversations = [conv for path in sorted(glob.glob(DATA_GLOB)) for conv in load_conversations(path)]
+    if args.padding:
+        conversations = [conv.replace(" ", " " * (args.padding + 1)) for conv in conversations]
+    total_chars = sum(len(conv) for conv in conversations)
+    print(f"{len(conversations)} conversations, {total_chars} characters")
+
+    for name, fn in (("legacy helpers", legacy_batch), ("normalize_batch", normalize_batch)):
+        best = min(timeit.repeat(lambda: fn(conversations), number=1, repeat=args.repeat))
+        print(f"{name:>16}: {best * 1000:8.2f} ms  ({total_chars / best / 1e6:6.1f} M chars/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Compact, indexed, memory-mappable storage for the conversation datasets.
+
+Every line of the .txt datasets repeats the same <SYS> system message and one of ~33 seed user
+messages. A .corpus file stores each distinct system message / seed message once (a string table)
+and each conversation as a small record of (role, offset) turns plus its text, with an
+offset index at the end, so conversation N (or turn K of it) can be read without parsing the rest.
+
+Conversations are stored losslessly: a line is only split at its "USER:" / "ASSISTANT:" markers and
+every turn keeps its raw text, whitespace and newlines included, so reader[n] is exactly the line that
+was added. Normalize with parse_turns(reader[n]) where that is wanted.
+
+Usage:
+    python corpus.py convert new_data/*.txt incorrect_data/*.txt   # writes <name>.corpus next to each file
+    python corpus.py show new_data/final_data.corpus 42
+"""
+import argparse
+import mmap
+import os
+import struct
+
+from normalizer import TURN_MARKER, load_conversations, render_turns
+
+MAGIC = b"CONVCRP2"
+# magic, number of strings, number of conversations, string table offset, index offset
+HEADER = struct.Struct("<8sIIQQ")
+# system message id, seed user message id (-1 for none), number of stored turns, text blob length in bytes
+RECORD = struct.Struct("<iiHI")
+# role code, offset of the turn's text within the record's text blob (it ends where the next turn starts)
+TURN = struct.Struct("<BI")
+OFFSET = struct.Struct("<Q")
+LENGTH = struct.Struct("<I")
+ROLES = ("USER", "ASSISTANT", "SYSTEM")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+class CorpusWriter:
+    """Writes conversations to a .corpus file. Use as a context manager (or call close())."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "wb")
+        self.f.write(b"\0" * HEADER.size)  # real header is written by close()
+        self.strings = {}
+        self.offsets = []
+
+    def _string_id(self, text):
+        return self.strings.setdefault(text, len(self.strings))
+
+    def add(self, conversation):
+        """Add one conversation, given as a dataset line or as a list of (role, text) turns (which are
+        joined with render_turns() first)."""
+        if not isinstance(conversation, str):
+            conversation = render_turns(conversation)
+        # [text before the first marker, role, text, role, text, ...], nothing stripped or collapsed
+        parts = TURN_MARKER.split(conversation)
+        turns = list(zip(parts[1::2], parts[2::2]))
+        system_id = self._string_id(parts[0]) if parts[0] else -1
+        seed_id = -1
+        if turns and turns[0][0] == "USER":
+            seed_id = self._string_id(turns.pop(0)[1])
+
+        table = []
+        blob = []
+        position = 0
+        for role, text in turns:
+            data = text.encode("utf-8")
+            table.append(TURN.pack(ROLE_CODES[role], position))
+            blob.append(data)
+            position += len(data)
+
+        self.offsets.append(self.f.tell())
+        self.f.write(RECORD.pack(system_id, seed_id, len(turns), position))
+        self.f.write(b"".join(table))
+        self.f.write(b"".join(blob))
+
+    def close(self):
+        strings_offset = self.f.tell()
+        for text in self.strings:  # dicts keep insertion order, i.e. id order
+            data = text.encode("utf-8")
+            self.f.write(LENGTH.pack(len(data)) + data)
+        index_offset = self.f.tell()
+        self.f.write(b"".join(OFFSET.pack(offset) for offset in self.offsets))
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, len(self.strings), len(self.offsets), strings_offset, index_offset))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusReader:
+    """Random access to a .corpus file through mmap; only the string table is decoded up front."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_strings, self.num_conversations, strings_offset, self.index_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a conversation corpus file")
+        self.strings = []
+        position = strings_offset
+        for _ in range(num_strings):
+            (length,) = LENGTH.unpack_from(self.mm, position)
+            position += LENGTH.size
+            self.strings.append(self.mm[position:position + length].decode("utf-8"))
+            position += length
+
+    def __len__(self):
+        return self.num_conversations
+
+    def _record(self, n):
+        if not 0 <= n < self.num_conversations:
+            raise IndexError(n)
+        (offset,) = OFFSET.unpack_from(self.mm, self.index_offset + n * OFFSET.size)
+        system_id, seed_id, num_turns, blob_length = RECORD.unpack_from(self.mm, offset)
+        table_offset = offset + RECORD.size
+        return system_id, seed_id, num_turns, blob_length, table_offset, table_offset + num_turns * TURN.size
+
+    def turn(self, n, k):
+        """Return turn K (role, raw text) of conversation N, counting the system message and seed message as turns."""
+        system_id, seed_id, num_turns, blob_length, table_offset, blob_offset = self._record(n)
+        for role, string_id in (("SYSTEM", system_id), ("USER", seed_id)):
+            if string_id != -1:
+                if k == 0:
+                    return role, self.strings[string_id]
+                k -= 1
+        if not 0 <= k < num_turns:
+            raise IndexError(k)
+        return self._stored_turn(num_turns, blob_length, table_offset, blob_offset, k)
+
+    def _stored_turn(self, num_turns, blob_length, table_offset, blob_offset, i):
+        role, start = TURN.unpack_from(self.mm, table_offset + i * TURN.size)
+        end = TURN.unpack_from(self.mm, table_offset + (i + 1) * TURN.size)[1] if i + 1 < num_turns else blob_length
+        return ROLES[role], self.mm[blob_offset + start:blob_offset + end].decode("utf-8")
+
+    def iter_turns(self, n):
+        """Yield the (role, raw text) turns of conversation N one at a time."""
+        system_id, seed_id, num_turns, blob_length, table_offset, blob_offset = self._record(n)
+        if system_id != -1:
+            yield "SYSTEM", self.strings[system_id]
+        if seed_id != -1:
+            yield "USER", self.strings[seed_id]
+        for i in range(num_turns):
+            yield self._stored_turn(num_turns, blob_length, table_offset, blob_offset, i)
+
+    def __getitem__(self, n):
+        """Conversation N, exactly as it was added."""
+        return "".join(text if role == "SYSTEM" else f"{role}:{text}" for role, text in self.iter_turns(n))
+
+    def __iter__(self):
+        for n in range(self.num_conversations):
+            yield self[n]
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert(path, output=None):
+    """Convert a one-conversation-per-line .txt dataset to .corpus and return the output path."""
+    output = output or os.path.splitext(path)[0] + ".corpus"
+    with CorpusWriter(output) as writer:
+        for conversation in load_conversations(path):
+            writer.add(conversation)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert / inspect .corpus conversation files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert .txt datasets to .corpus files")
+    convert_parser.add_argument("inputs", nargs="+")
+    show_parser = subparsers.add_parser("show", help="print conversation N of a .corpus file")
+    show_parser.add_argument("corpus")
+    show_parser.add_argument("n", type=int)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for path in args.inputs:
+            output = convert(path)
+            with CorpusReader(output) as reader:
+                count = len(reader)
+            print(f"{path} -> {output}: {count} conversations, {os.path.getsize(path)} -> {os.path.getsize(output)} bytes")
+    else:
+        with CorpusReader(args.corpus) as reader:
+            for role, text in reader.iter_turns(args.n):
+                print(f"{role}: {text.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,22 @@
-import replicate
 import random
 import logging
 import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# llm_client.py lives at the repository root and is shared with chain_of_density_summarization/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import add, instrument, metrics
+from llm_client import LLMClient, LLMError, ReplicateBackend, TokenBucket, get_client
+from checkpoint import CHECKPOINT_EVERY, JsonlCheckpointWriter, completed_indices, read_records
+from dedup import DedupIndex
+from normalizer import normalize_turns, render_turns
+from prefilter import PrefilterCascade
+from quality_cache import QualityCache, make_run_id
 
 # Configuration
 # DO NOT CHANGE THESE PARAMETERS
@@ -11,48 +26,150 @@ MAX_NEW_TOKENS = 128
 # YOU CAN CHANGE THESE PARAMETERS
 NUM_CONVERSATIONS = 200
 QUALITY_THRESHOLD = 4
+NUM_WORKERS = 8  # number of conversations generated / rated at the same time
+IN_FLIGHT_PER_WORKER = 4  # calls queued per worker and stage, so one slow call does not leave the other workers idle
+REQUESTS_PER_SECOND = 2.0  # token bucket refill rate shared by every replicate.run call
+BURST_SIZE = 4  # how many requests can go out back-to-back before the rate limit kicks in
+MAX_ASSISTANT_TURNS = 6  # conversations are capped at this many ASSISTANT turns (and streaming stops past it)
+SEED = 584  # fixes which seed user message each conversation starts from
+CACHE_PATH = "quality_cache.sqlite3"  # ratings survive crashes / re-runs here
+CACHE_MAX_ENTRIES = 100000  # least recently used ratings are evicted past this many
+DEDUP_THRESHOLD = 0.8  # near-duplicates (MinHash similarity >= this) are not rated; None turns dedup off
+PREFILTER_REJECT_CONFIDENCE = 0.8  # local heuristics this sure a conversation is bad skip the model rating
+PREFILTER_ACCEPT_CONFIDENCE = None  # set (at most 0.9, see prefilter.py) to also auto-accept conversations every heuristic is sure about
+HIGH_QUALITY_FILE = "new_synth_data_6.jsonl"
+LOW_QUALITY_FILE = "low_quality_conversations_8.jsonl"
+METRICS_JSON = "data_creation_metrics.json"  # per-stage latency / token / cost summary (instrumentation.py)
+METRICS_PROM = "data_creation_metrics.prom"  # the same numbers as a Prometheus text file
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 
-# Cache structure: {"conversation": String, "quality": Integer}
-conversation_quality_cache = {}
-conversations = []
+# Prompt used to rate a conversation; it is part of the cache key, so editing it invalidates old ratings
+QUALITY_PROMPT = "Please rate the following conversation on a scale of 1 to 5. \
+                Do not output anything other than a number between 1 and 5. \
+                You must only output a digit, which will always be between 1 and 5. \
+                This number will represent the quality of the conversation based on:\
+                \\nRelevance: Does the conversation stay on topic and avoid irrelevant or off-topic remarks? \
+                \\nContent: Is the conversation informative, engaging, and thought-provoking? \
+                \\nClarity: Are the messages clear, concise, and easy to understand? \
+                \\nGrammar and Style: Is the language used correctly and appropriately? \
+                \\nEngagement: Does the conversation encourage participation and interaction between the participants? \
+                \\n\\n{conversation}\\n\\nRating:"
 
+# Cache structure: sha256(normalized conversation, QUALITY_PROMPT, MODEL_NAME) -> quality (see quality_cache.py)
+_quality_cache = None
+_quality_cache_lock = threading.Lock()
+
+SYSTEM_MESSAGE = "<SYS> You are an AI assistant that can generate synthetic conversations between a human user and an AI assistant. You are helpful, polite, honest, sophisticated, emotionally aware, and humble-but-knowledgeable. You respond empathetically to the user with open, conversational follow-up questions. The human is intellectually curious and asks you thoughtful, thorough follow-up questions. </SYS>"
+USER_MESSAGES = [
+    "I'm curious about the origins of language. Can you share some insights on how language evolved over time?",
+    "I'm fascinated by the world of dreams. Can you explain the different types of dreams and their possible interpretations?",
+    "What do you think about the latest iPhone?",
+    "What is your favorite programming language?",
+    "What is your favorite movie?",
+    "I'm interested in learning more about the cosmos. Can you describe the various planets and celestial objects in our solar system?",
+    "I'm intrigued by the human brain and its incredible capabilities. Can you explain how the brain processes information and generates thoughts?",
+    "I'm passionate about music and its ability to evoke emotions. Can you discuss the history of music and the different genres that have emerged over time?",
+    "I'm interested in understanding different cultures and their unique traditions. Can you share some insights into the customs and beliefs of various cultures around the world?",
+    "What are the latest developments in AI? How is AI being used in different industries?",
+    "Can you explain the theory of relativity and its implications for our understanding of the universe?",
+    "Can you discuss the ethical considerations and potential applications of AI?",
+    "What is your favorite book? Can you explain the plot and themes of the book?",
+    "If you could have any superpower, what would it be?",
+    "Would you rather be able to fly or be invisible?",
+    "What would you do if you won the lottery?",
+    "If you could travel anywhere in the world, where would you go?",
+    "In your opinion, what is the meaning of life?",
+    "Can you help me with my homework? What is the answer to this question? 2 + 2 = ?",
+    "Describe your ideal vacation.",
+    "Give me ideas for a fun date.",
+    "Translate this English text to Hindi.",
+    "What is the weather like today?",
+    "Explain the plot of the movie Tenet.",
+    "How can I improve my coding skills?",
+    "What is the best way to learn a new language?",
+    "How many languages does an average person speak?",
+    "How can I get admitted to Emory University?",
+    "What is the best way to prepare for a job interview?",
+    "Suggest a diet plan for me.",
+    "How to get started with Gym?",
+    "What is the best way to learn how to swim?",
+    "How to lose weight?",
+    # "I want to have a short, iteractive conversation with you. We can talk about anything, including hobbies, coding, technology, etc.""
+]
+
+
+@instrument()
+def run_mistral(prompt, max_new_tokens=MAX_NEW_TOKENS, stop=None):
+    """Run the model and return "ASSISTANT: " + the generated text.
+
+    The model streams its output token by token. If `stop` is given, it is called with every new
+    token and, as soon as it returns True (see stop_at_first_digit and stop_after_turns), the stream is
+    closed and the Replicate prediction is cancelled, which saves both latency and billed tokens when
+    the caller only needs a prefix.
+
+    Calls go through the shared Replicate client (llm_client.py), which reuses one connection pool,
+    retries 429 / 5xx / connection errors with backoff, and raises LLMError if the call still fails.
+    """
+    return "ASSISTANT: " + replicate_client().complete(prompt, max_new_tokens=max_new_tokens, stop=stop)
 
-def run_mistral(prompt, max_new_tokens=MAX_NEW_TOKENS):
-    try:
-        output = replicate.run(
-            MODEL_NAME,
-            input={"prompt": prompt, "max_new_tokens": max_new_tokens},
-        )
-        final = "ASSISTANT: "
-        # HINT: See if you want to change this to keep only the first output. What are the benefits / drawbacks?
-        for item in output:
-            final = final + item
-        return final
-    except Exception as e:
-        logging.error(f"API call failed with error: {e}")
-        return ""
 
+def quality_cache():
+    """The process-wide QualityCache, opened on first use (so importing this module does not create CACHE_PATH)."""
+    global _quality_cache
+    with _quality_cache_lock:
+        if _quality_cache is None:
+            _quality_cache = QualityCache(CACHE_PATH, QUALITY_PROMPT, MODEL_NAME, max_entries=CACHE_MAX_ENTRIES)
+        return _quality_cache
+
+
+def replicate_client():
+    return get_client("replicate", lambda: LLMClient(ReplicateBackend(MODEL_NAME), max_concurrency=NUM_WORKERS))
+
+
+# Stop predicate for rating calls: only the first digit of the answer is used, so stop once we have one
+def stop_at_first_digit():
+    def stop(token):
+        return any(char.isdigit() for char in token)
+
+    return stop
+
+
+def stop_after_turns(max_turns, role="ASSISTANT"):
+    """Stop predicate that is satisfied once the output starts turn `max_turns` + 1 of `role`.
+
+    The prompt already ends with "ASSISTANT:", so the first turn has no marker in the output and
+    every further "ASSISTANT:" starts a new turn. Markers split across tokens are handled by keeping
+    the last few characters of the previous token around.
+    """
+    marker = f"{role}:"
+    state = {"turns": 1, "tail": ""}
 
-def check_conversation_quality(conversation):
-    # Get quality from cache or set default to None
-    quality = conversation_quality_cache.get(conversation, {}).get("quality")
+    def stop(token):
+        text = state["tail"] + token
+        state["turns"] += text.count(marker)
+        # too short to hold a whole marker, so a marker is never counted twice
+        state["tail"] = text[-(len(marker) - 1):]
+        return state["turns"] > max_turns
+
+    # called by the client before a retried call starts streaming again
+    stop.reset = lambda: state.update(turns=1, tail="")
+    return stop
+
+
+def check_conversation_quality(conversation, backend=None):
+    backend = backend or run_mistral
+    # Get quality from cache (None if it was never rated)
+    quality = quality_cache().get(conversation)
+    add(**{"cache_hits" if quality is not None else "cache_misses": 1})
 
     if quality is None:
         # write a detailed prompt to get a rating for the conversation
-        quality_prompt = f"Please rate the following conversation on a scale of 1 to 5. \
-                        Do not output anything other than a number between 1 and 5. \
-                        You must only output a digit, which will always be between 1 and 5. \
-                        This number will represent the quality of the conversation based on:\
-                        \\nRelevance: Does the conversation stay on topic and avoid irrelevant or off-topic remarks? \
-                        \\nContent: Is the conversation informative, engaging, and thought-provoking? \
-                        \\nClarity: Are the messages clear, concise, and easy to understand? \
-                        \\nGrammar and Style: Is the language used correctly and appropriately? \
-                        \\nEngagement: Does the conversation encourage participation and interaction between the participants? \
-                        \\n\\n{conversation}\\n\\nRating:"
-        rating = run_mistral(quality_prompt)
+        quality_prompt = QUALITY_PROMPT.format(conversation=conversation)
+        # the model may write whitespace or prose before the number, so the stream is not capped; it is
+        # closed (and the prediction cancelled) as soon as the first digit arrives
+        rating = backend(quality_prompt, stop=stop_at_first_digit())
 
         try:
             print(rating)
@@ -63,127 +180,286 @@ def check_conversation_quality(conversation):
         except Exception as e:
             print("Error: ", e)
             quality = 3
-        conversation_quality_cache[conversation] = {"quality": quality}
+        quality_cache().put(conversation, quality)
 
     return quality
 
 
-def generate_conversation():
+def generate_conversation(user_message=None, backend=None):
     """
     The goal of this function is to generate a different conversation each time.
-    TODO: In this function edit the code to make sure that the conversation block as at most 6 assistant messages.
-    TODO: If it has more than 6 blocks, only use the first 6.
+    The conversation block has at most MAX_ASSISTANT_TURNS (6) assistant messages; later ones are dropped.
+
+    `user_message` lets the caller pick the seed message (so a seeded run is reproducible), and
+    `backend` swaps out run_mistral, e.g. for the fake backend in fake_backend.py.
     """
-    system_message = "<SYS> You are an AI assistant that can generate synthetic conversations between a human user and an AI assistant. You are helpful, polite, honest, sophisticated, emotionally aware, and humble-but-knowledgeable. You respond empathetically to the user with open, conversational follow-up questions. The human is intellectually curious and asks you thoughtful, thorough follow-up questions. </SYS>"
-    user_messages = [
-        "I'm curious about the origins of language. Can you share some insights on how language evolved over time?",
-        "I'm fascinated by the world of dreams. Can you explain the different types of dreams and their possible interpretations?",
-        "What do you think about the latest iPhone?",
-        "What is your favorite programming language?",
-        "What is your favorite movie?",
-        "I'm interested in learning more about the cosmos. Can you describe the various planets and celestial objects in our solar system?",
-        "I'm intrigued by the human brain and its incredible capabilities. Can you explain how the brain processes information and generates thoughts?",
-        "I'm passionate about music and its ability to evoke emotions. Can you discuss the history of music and the different genres that have emerged over time?",
-        "I'm interested in understanding different cultures and their unique traditions. Can you share some insights into the customs and beliefs of various cultures around the world?",
-        "What are the latest developments in AI? How is AI being used in different industries?",
-        "Can you explain the theory of relativity and its implications for our understanding of the universe?",
-        "Can you discuss the ethical considerations and potential applications of AI?",
-        "What is your favorite book? Can you explain the plot and themes of the book?",
-        "If you could have any superpower, what would it be?",
-        "Would you rather be able to fly or be invisible?",
-        "What would you do if you won the lottery?",
-        "If you could travel anywhere in the world, where would you go?",
-        "In your opinion, what is the meaning of life?",
-        "Can you help me with my homework? What is the answer to this question? 2 + 2 = ?",
-        "Describe your ideal vacation.",
-        "Give me ideas for a fun date.",
-        "Translate this English text to Hindi.",
-        "What is the weather like today?",
-        "Explain the plot of the movie Tenet.",
-        "How can I improve my coding skills?",
-        "What is the best way to learn a new language?",
-        "How many languages does an average person speak?",
-        "How can I get admitted to Emory University?",
-        "What is the best way to prepare for a job interview?",
-        "Suggest a diet plan for me.",
-        "How to get started with Gym?",
-        "What is the best way to learn how to swim?",
-        "How to lose weight?",
-        # "I want to have a short, iteractive conversation with you. We can talk about anything, including hobbies, coding, technology, etc.""
-    ]
-    user_message = random.choice(user_messages)
-    prompt = f"{system_message}\nUSER: {user_message}\nASSISTANT:"
-    conversation = run_mistral(prompt)
-    # Remove extra spaces and truncate conversation to last punctuation mark
-    conversation = truncate_conversation(remove_extra_spaces(conversation))
-    conversation = system_message + " USER: " + user_message + " " + conversation
+    backend = backend or run_mistral
+    if user_message is None:
+        user_message = random.choice(USER_MESSAGES)
+    model_output = backend(build_prompt(user_message), stop=stop_after_turns(MAX_ASSISTANT_TURNS))
+    conversation = build_conversation(user_message, model_output)
     print(conversation)
-    # Store in cache (with quality uninitialized)
-    conversation_quality_cache[conversation] = {}
-    # print(conversation_quality_cache)
     return conversation
 
 
-# Helper function to remove extra spaces
-def remove_extra_spaces(conversation):
-    while "  " in conversation:
-        conversation = conversation.replace("  ", " ")
-    return conversation
+def build_prompt(user_message):
+    return f"{SYSTEM_MESSAGE}\nUSER: {user_message}\nASSISTANT:"
 
 
-# Helper function to truncate conversation to last punctuation mark
-def truncate_conversation(conversation):
-    punctuation = [".", "!", "?"]
-    for i in range(len(conversation) - 1, -1, -1):
-        if conversation[i] in punctuation:
-            return conversation[: i + 1]
-    return conversation
+def build_conversation(user_message, model_output):
+    # Split into turns, collapse whitespace, keep the first MAX_ASSISTANT_TURNS assistant turns and
+    # truncate to the last punctuation mark, all in one pass (see normalizer.py)
+    conversation = render_turns(normalize_turns(model_output, MAX_ASSISTANT_TURNS))
+    return SYSTEM_MESSAGE + " USER: " + user_message + " " + conversation
+
+
+# Helper function that makes every call to `backend` wait for the rate limiter first
+def rate_limited(backend, limiter):
+    def limited_backend(prompt, *args, **kwargs):
+        start = time.perf_counter()
+        limiter.acquire()
+        add(queue_wait=time.perf_counter() - start)
+        return backend(prompt, *args, **kwargs)
+
+    return limited_backend
+
+
+# Helper function that runs `fn` over `items` on `executor`, yielding results in input order
+# while keeping at most `window` calls submitted (so memory does not grow with the number of items).
+# While the oldest call is still running, up to `window` - 1 later ones are queued behind it, so with
+# `window` well above the executor's worker count a slow call does not leave the other workers idle.
+def ordered_map(executor, fn, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def seed_stage(num_conversations, seed, skip=()):
+    """Yield one record per conversation to produce, with its seed user message drawn from `random.Random(seed)`.
+
+    Indices in `skip` (already written by an earlier run) are still drawn, so every other index
+    keeps the same seed message, but they are not yielded.
+    """
+    rng = random.Random(seed)
+    for idx in range(num_conversations):
+        user_message = rng.choice(USER_MESSAGES)
+        if idx not in skip:
+            yield {"idx": idx, "seed": seed, "user_message": user_message, "timings": {}}
+
+
+def generate_stage(records, executor, window, backend, run_id=None):
+    """Call the model for every record (or reuse the conversation stored for (run_id, idx) in the quality cache).
+
+    Every call is recorded by instrumentation.py under the "generation" stage.
+    """
+
+    def generate(record):
+        start = time.perf_counter()
+        conversation = None
+        try:
+            with instrument("generation"):
+                if run_id is not None:
+                    conversation = quality_cache().get_generated(run_id, record["idx"])
+                    add(**{"cache_hits" if conversation is not None else "cache_misses": 1})
+                if conversation is None:
+                    record["raw"] = backend(
+                        build_prompt(record["user_message"]), stop=stop_after_turns(MAX_ASSISTANT_TURNS)
+                    )
+        except LLMError as e:
+            # left out of the output files, so a resumed run tries it again
+            record["error"] = str(e)
+        if conversation is not None:
+            record["text"] = conversation
+        record["timings"]["generate_s"] = time.perf_counter() - start
+        return record
+
+    return ordered_map(executor, generate, records, window)
+
+
+def normalize_stage(records, run_id=None):
+    """Turn raw model output into the final one-line conversation text."""
+    for record in records:
+        if "text" not in record and "error" not in record:
+            record["text"] = build_conversation(record["user_message"], record.pop("raw"))
+            if run_id is not None:
+                quality_cache().put_generated(run_id, record["idx"], record["text"])
+        yield record
+
+
+def dedup_stage(records, index):
+    """Mark near-duplicates of an earlier conversation with "duplicate_of" so they are not rated.
+
+    Runs in index order on the consuming thread, so which conversation of a cluster is kept only
+    depends on the seed.
+    """
+    for record in records:
+        if "error" not in record:
+            duplicate_of = index.add(record["idx"], record["text"])
+            if duplicate_of is not None:
+                record["duplicate_of"] = duplicate_of
+        yield record
+
+
+def prefilter_stage(records, cascade):
+    """Give obviously bad (or, if enabled, obviously good) conversations a quality without asking the model."""
+    for record in records:
+        if "duplicate_of" not in record and "error" not in record:
+            decision, quality, reasons = cascade.evaluate(record["text"])
+            if decision is not None:
+                record["quality"] = quality
+                record["prefilter"] = {"decision": decision, "reasons": reasons}
+        yield record
+
+
+def rate_stage(records, executor, window, backend):
+    """Rate every record as soon as it comes out of the previous stage.
+
+    Near-duplicates, records the prefilter already decided on and failed generations are not sent to the model.
+    Every rating is recorded by instrumentation.py under the "rating" stage.
+    """
+
+    def rate(record):
+        if "duplicate_of" in record:
+            record["quality"] = None
+            return record
+        if "prefilter" in record or "error" in record:
+            return record
+        start = time.perf_counter()
+        try:
+            with instrument("rating"):
+                record["quality"] = check_conversation_quality(record["text"], backend=backend)
+        except LLMError as e:
+            record["error"] = str(e)
+        record["timings"]["rate_s"] = time.perf_counter() - start
+        return record
+
+    return ordered_map(executor, rate, records, window)
+
+
+def route(records, high_writer, low_writer, threshold=QUALITY_THRESHOLD):
+    """Append each rated record to the high- or low-quality JSONL file and return how many went to each.
+
+    Near-duplicates go to the low-quality file too (with quality None), so a resumed run skips them.
+    Records whose model call failed are logged and not written, so a resumed run retries them.
+    """
+    counts = {"high": 0, "low": 0, "duplicates": 0, "failed": 0}
+    for record in records:
+        if "error" in record:
+            logging.error(f"Conversation {record['idx']} failed: {record['error']}")
+            counts["failed"] += 1
+        elif "duplicate_of" in record:
+            low_writer.write(record)
+            counts["duplicates"] += 1
+        elif record["quality"] >= threshold:
+            high_writer.write(record)
+            counts["high"] += 1
+        else:
+            low_writer.write(record)
+            counts["low"] += 1
+    return counts
+
+
+def run_pipeline(
+    num_conversations=NUM_CONVERSATIONS,
+    num_workers=NUM_WORKERS,
+    requests_per_second=REQUESTS_PER_SECOND,
+    burst_size=BURST_SIZE,
+    seed=SEED,
+    backend=None,
+    skip=(),
+    resume=True,
+    dedup_index=None,
+    prefilter=None,
+    max_in_flight=None,
+):
+    """Lazily generate -> normalize -> rate `num_conversations` conversations on `num_workers` threads.
+
+    Yields records ({"idx", "seed", "user_message", "text", "quality", "timings"}) in index order, so
+    the output only depends on the seed (and the backend), not on which worker finished first. Rating
+    of a conversation starts as soon as it is generated. At most `num_workers` calls run at a time and
+    at most `max_in_flight` (IN_FLIGHT_PER_WORKER * num_workers by default) per stage are submitted, so
+    a slow call does not stall the other workers and memory stays flat however many conversations are
+    requested. Pass `backend` (e.g. fake_backend.make_fake_mistral()) to run without Replicate. With
+    `resume`, conversations generated by an earlier run with the same seed and generation settings are
+    read back from the quality cache. With a `dedup_index` (dedup.DedupIndex), near-duplicates of
+    earlier conversations are not rated, and with a `prefilter` (prefilter.PrefilterCascade) only
+    conversations it is unsure about are rated.
+    """
+    limiter = TokenBucket(requests_per_second, burst_size)
+    if backend is None:
+        # the shared client is created for NUM_WORKERS; let it run as many calls as this pipeline has workers
+        replicate_client().set_concurrency(num_workers)
+    limited_backend = rate_limited(backend or run_mistral, limiter)
+    # stored generations are only reused if nothing that shapes a generation changed since they were made
+    run_id = None
+    if resume:
+        run_id = make_run_id(seed, [SYSTEM_MESSAGE, MODEL_NAME, MAX_NEW_TOKENS, MAX_ASSISTANT_TURNS, *USER_MESSAGES])
+
+    window = max_in_flight or IN_FLIGHT_PER_WORKER * num_workers
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        records = seed_stage(num_conversations, seed, skip)
+        records = generate_stage(records, executor, window, limited_backend, run_id)
+        records = normalize_stage(records, run_id)
+        if dedup_index is not None:
+            records = dedup_stage(records, dedup_index)
+        if prefilter is not None:
+            records = prefilter_stage(records, prefilter)
+        records = rate_stage(records, executor, window, limited_backend)
+        yield from records
 
 
 def main():
-    logging.info("Generating conversations...")
+    logging.info("Generating and rating conversations...")
     # Export Replicate API Token as an environment variable
     os.environ[
         "REPLICATE_API_TOKEN"
     ] = "<REPLICATE_API_TOKEN>"
 
-    # conversations is a global variable
-    conversations = [generate_conversation() for _ in range(NUM_CONVERSATIONS)]
+    # Conversations already written by an interrupted run with the same seed are skipped
+    done = completed_indices([HIGH_QUALITY_FILE, LOW_QUALITY_FILE], SEED)
+    if done:
+        logging.info(f"Resuming: {len(done)} conversations already saved.")
 
-    # HINT: You should save the generated conversations to a file, so you can then inspect them, filter them etc.
+    dedup_index = None
+    if DEDUP_THRESHOLD is not None:
+        dedup_index = DedupIndex(threshold=DEDUP_THRESHOLD)
+        # conversations saved by an interrupted run still count as "seen"
+        for path in (HIGH_QUALITY_FILE, LOW_QUALITY_FILE):
+            for record in read_records(path):
+                if record.get("seed") == SEED and "duplicate_of" not in record:
+                    dedup_index.add(record["idx"], record["text"])
 
-    logging.info("Filtering by quality...")
-    high_quality_conversations = []
-    low_quality_conversations = []
-    for conv in conversations:
-        quality = check_conversation_quality(conv)
-        if quality >= QUALITY_THRESHOLD:
-            high_quality_conversations.append(conv)
-        else:
-            low_quality_conversations.append(conv)
-
-    # HINT: You should save the quality dict (`conversation_quality_cache`) and see if the ratings are what you want.
-    with open("new_synth_data_5.txt", "w") as f:
-        for conv in high_quality_conversations:
-            try:
-                conversation_formatted = conv.replace(
-                    "\n", " "
-                )  # escape newlines, so you can keep your result on one line in the output
-                f.write(conversation_formatted + "\n")
-            except:
-                print("Error")
-
-    with open("low_quality_conversations_7.txt", "w") as f:
-        for conv in low_quality_conversations:
-            try:
-                conversation_formatted = conv.replace("\n", "\\n")
-                f.write(conversation_formatted + "\n")
-            except:
-                print("Error")
+    # Every record is appended to its file as soon as it is rated (newlines are escaped by JSON)
+    with JsonlCheckpointWriter(HIGH_QUALITY_FILE, CHECKPOINT_EVERY) as high_writer, JsonlCheckpointWriter(
+        LOW_QUALITY_FILE, CHECKPOINT_EVERY
+    ) as low_writer:
+        prefilter = PrefilterCascade(
+            reject_confidence=PREFILTER_REJECT_CONFIDENCE,
+            accept_confidence=PREFILTER_ACCEPT_CONFIDENCE,
+            accept_quality=QUALITY_THRESHOLD,
+        )
+        records = run_pipeline(skip=done, dedup_index=dedup_index, prefilter=prefilter)
+        counts = route(records, high_writer, low_writer)
 
     logging.info(
-        f"Saved {len(high_quality_conversations)} high-quality conversations."
+        f"Saved {counts['high']} high-quality and {counts['low']} low-quality conversations."
+    )
+    logging.info(f"Skipped rating {counts['duplicates']} near-duplicate conversations.")
+    if counts["failed"]:
+        logging.warning(f"{counts['failed']} conversations failed; run again to retry them.")
+    logging.info(
+        f"Prefilter saved {prefilter.calls_saved} model calls "
+        f"({prefilter.counts['rejected']} rejected, {prefilter.counts['accepted']} accepted, "
+        f"{prefilter.counts['sent_to_model']} sent to the model)."
     )
+    logging.info(f"Quality cache: {quality_cache().stats()}")
+    metrics.write_json(METRICS_JSON)
+    metrics.write_prometheus(METRICS_PROM)
+    logging.info(f"Metrics written to {METRICS_JSON} and {METRICS_PROM}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+"""Near-duplicate detection for the synthetic conversation datasets (MinHash + LSH).
+
+Offline usage:
+    python dedup.py new_data/final_data.txt incorrect_data/synthetic_dataset_*.txt \
+        --output deduped.txt --report duplicate_clusters.json
+
+data_creation.py also uses DedupIndex inline, so near-duplicates are not sent for a (paid) rating.
+"""
+import argparse
+import json
+import re
+import zlib
+
+import numpy as np
+
+from normalizer import load_conversations, parse_turns
+
+SHINGLE_SIZE = 5  # words per shingle
+NUM_PERM = 128  # MinHash signature length
+NUM_BANDS = 32  # LSH bands (NUM_PERM / NUM_BANDS rows each)
+DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity at or above which two conversations are duplicates
+PRIME = (1 << 31) - 1
+SHINGLE_BASE = np.uint64(1000003)
+WORD = re.compile(r"\w+")
+
+
+def conversation_words(conversation):
+    """Lower-cased words of a conversation, without the <SYS> system message every conversation shares."""
+    text = " ".join(text for role, text in parse_turns(conversation) if role != "SYSTEM")
+    return WORD.findall(text.lower())
+
+
+def shingle_hashes(words, shingle_size=SHINGLE_SIZE):
+    """Hash every run of `shingle_size` consecutive words to an integer in [0, PRIME), vectorized over the text.
+
+    Each word is hashed once (crc32), then all shingles are combined at once as a polynomial
+    sum(word_hash[i + j] * SHINGLE_BASE**j) with uint64 wraparound.
+    """
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    size = min(shingle_size, len(word_hashes))
+    count = len(word_hashes) - size + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(size):
+            shingles = shingles * SHINGLE_BASE + word_hashes[j:j + count]
+    return np.unique((shingles ^ (shingles >> np.uint64(32))) % np.uint64(PRIME))
+
+
+class MinHasher:
+    """Computes NUM_PERM-long MinHash signatures with random (a * x + b) mod PRIME permutations."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        # a, b < 2**31 and x < 2**31, so a * x + b fits in a uint64 without overflowing
+        self.a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingles):
+        if len(shingles) == 0:
+            return np.full(self.num_perm, PRIME, dtype=np.uint64)
+        return ((self.a[:, None] * shingles[None, :] + self.b[:, None]) % np.uint64(PRIME)).min(axis=1)
+
+
+class DedupIndex:
+    """LSH index over MinHash signatures.
+
+    add() returns the key of an earlier conversation this one is a near-duplicate of (or None, in
+    which case it becomes the representative of a new cluster). Only representatives are indexed,
+    so every cluster is "representative + its duplicates".
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM, num_bands=NUM_BANDS, seed=0):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, seed)
+        self.num_bands = num_bands
+        self.rows = num_perm // num_bands
+        self.buckets = {}
+        self.signatures = {}
+        self.clusters = {}
+
+    def _bands(self, signature):
+        for band in range(self.num_bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find(self, conversation):
+        """Return (key, similarity, signature) of the closest indexed conversation at or above the threshold (key None if there is none)."""
+        signature = self.hasher.signature(shingle_hashes(conversation_words(conversation)))
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self.buckets.get(band, ()))
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key, best_similarity, signature
+
+    def add(self, key, conversation):
+        duplicate_of, similarity, signature = self.find(conversation)
+        if duplicate_of is not None:
+            self.clusters[duplicate_of].append((key, similarity))
+            return duplicate_of
+        self.signatures[key] = signature
+        self.clusters[key] = []
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(key)
+        return None
+
+    def duplicate_clusters(self):
+        """Clusters with at least one duplicate: {representative key: [(duplicate key, similarity), ...]}."""
+        return {key: members for key, members in self.clusters.items() if members}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove near-duplicate conversations from dataset files.")
+    parser.add_argument("inputs", nargs="+", help="dataset files, one conversation per line")
+    parser.add_argument("--output", default="deduped.txt", help="deduplicated dataset (one conversation per line)")
+    parser.add_argument("--report", default="duplicate_clusters.json", help="JSON report of the duplicate clusters")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    args = parser.parse_args()
+
+    index = DedupIndex(threshold=args.threshold)
+    total = kept = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+        for path in args.inputs:
+            for line_number, conversation in enumerate(load_conversations(path), start=1):
+                total += 1
+                if index.add(f"{path}:{line_number}", conversation) is None:
+                    kept += 1
+                    out.write(conversation.replace("\n", "\\n") + "\n")
+
+    clusters = index.duplicate_clusters()
+    report = {
+        "threshold": args.threshold,
+        "conversations": total,
+        "kept": kept,
+        "duplicates": total - kept,
+        "clusters": [
+            {
+                "representative": key,
+                "duplicates": [{"conversation": member, "similarity": round(similarity, 3)} for member, similarity in members],
+            }
+            for key, members in sorted(clusters.items(), key=lambda item: -len(item[1]))
+        ],
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Kept {kept} of {total} conversations ({total - kept} near-duplicates in {len(clusters)} clusters).")
+
+
+if __name__ == "__main__":
+    main()
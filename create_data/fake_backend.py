@@ -0,0 +1,56 @@
+import random
+import re
+import time
+
+# Canned sentences the fake model stitches together into conversations
+FAKE_ASSISTANT_LINES = [
+    "That's a great question, and there is a lot to unpack here.",
+    "Many experts would say it depends on your goals and your background.",
+    "One way to think about it is to start small and build up over time.",
+    "Would you like me to go into more detail on any part of that?",
+    "It's a fascinating topic that people have studied for centuries.",
+    "I'd recommend looking at a few different sources to get a balanced view.",
+]
+FAKE_USER_LINES = [
+    "Can you tell me more about that?",
+    "That makes sense. What would you suggest as a first step?",
+    "Interesting! Why do you think that is?",
+    "How long does that usually take?",
+]
+
+
+def make_fake_mistral(latency=0.0, jitter=0.0, seed=0):
+    """Build a stand-in for run_mistral(prompt, max_new_tokens) that never touches the network.
+
+    Args:
+    - latency (float): Seconds every call sleeps, to mimic a replicate.run round-trip.
+    - jitter (float): Extra random sleep in [0, jitter) seconds, so workers finish out of order.
+    - seed (int): Makes the generated text depend only on (seed, prompt).
+
+    Returns:
+    - function: Same call signature and output format as run_mistral, including the `stop` predicate
+                (the fake output is "streamed" word by word so early termination can be tested).
+    """
+    jitter_rng = random.Random()
+
+    def fake_mistral(prompt, max_new_tokens=128, stop=None, **kwargs):
+        if latency or jitter:
+            time.sleep(latency + jitter_rng.random() * jitter)
+        # seeded per prompt (not per call) so results do not depend on thread scheduling
+        rng = random.Random(f"{seed}:{prompt}")
+        if prompt.rstrip().endswith("Rating:"):
+            text = f"{rng.randint(1, 5)} out of 5, because the conversation is on topic."
+        else:
+            turns = [rng.choice(FAKE_ASSISTANT_LINES)]
+            for _ in range(rng.randint(0, 7)):
+                turns.append("USER: " + rng.choice(FAKE_USER_LINES))
+                turns.append("ASSISTANT: " + rng.choice(FAKE_ASSISTANT_LINES))
+            text = "\n".join(turns)
+        parts = ["ASSISTANT: "]
+        for token in re.findall(r"\S+\s*", text):
+            parts.append(token)
+            if stop is not None and stop(token):
+                break
+        return "".join(parts)
+
+    return fake_mistral
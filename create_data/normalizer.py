@@ -0,0 +1,89 @@
+import re
+
+ROLES = ("USER", "ASSISTANT")
+SENTENCE_TERMINATORS = ".!?"
+MAX_ASSISTANT_TURNS = 6
+
+# "USER:" / "ASSISTANT:" markers, found in one regex scan over the conversation
+TURN_MARKER = re.compile(r"(USER|ASSISTANT):")
+
+
+def parse_turns(conversation):
+    """Split a conversation into (role, text) turns in a single pass.
+
+    Text before the first marker (e.g. the "<SYS> ... </SYS>" system message of a saved conversation)
+    becomes a ("SYSTEM", text) turn. Whitespace inside every turn is collapsed to single spaces and
+    turns that end up empty are dropped.
+
+    Args:
+    - conversation (str): Raw model output ("ASSISTANT: ... USER: ...") or a saved conversation line.
+
+    Returns:
+    - list: (role, text) tuples in order.
+    """
+    # collapse whitespace once over the whole string, then let the regex split it into
+    # [text before first marker, role, text, role, text, ...]
+    parts = TURN_MARKER.split(" ".join(conversation.split()))
+    roles = ["SYSTEM"] + parts[1::2]
+    return [(role, text.strip()) for role, text in zip(roles, parts[::2]) if text and not text.isspace()]
+
+
+def cap_turns(turns, max_assistant_turns=MAX_ASSISTANT_TURNS):
+    """Keep everything before the (max_assistant_turns + 1)-th ASSISTANT turn."""
+    assistant_turns = 0
+    for i, (role, _) in enumerate(turns):
+        if role == "ASSISTANT":
+            assistant_turns += 1
+            if assistant_turns > max_assistant_turns:
+                return turns[:i]
+    return turns
+
+
+def truncate_turns(turns):
+    """Cut the conversation right after its last sentence terminator (. ! ?), dropping any turns after it.
+
+    If there is no terminator anywhere, the turns are returned unchanged.
+    """
+    for i in range(len(turns) - 1, -1, -1):
+        role, text = turns[i]
+        end = max(text.rfind(char) for char in SENTENCE_TERMINATORS)
+        if end != -1:
+            return turns[:i] + [(role, text[: end + 1])]
+    return turns
+
+
+def normalize_turns(conversation, max_assistant_turns=MAX_ASSISTANT_TURNS):
+    """Parse, cap at `max_assistant_turns` ASSISTANT turns and truncate to the last full sentence."""
+    return truncate_turns(cap_turns(parse_turns(conversation), max_assistant_turns))
+
+
+def render_turns(turns):
+    """Join (role, text) turns back into the one-line "ROLE: text ROLE: text" format of the datasets."""
+    return " ".join(text if role == "SYSTEM" else f"{role}: {text}" for role, text in turns)
+
+
+def normalize_conversation(conversation, max_assistant_turns=MAX_ASSISTANT_TURNS):
+    return render_turns(normalize_turns(conversation, max_assistant_turns))
+
+
+def normalize_batch(conversations, max_assistant_turns=MAX_ASSISTANT_TURNS):
+    """normalize_conversation over many conversations (any iterable), returned as a list."""
+    return [normalize_conversation(conversation, max_assistant_turns) for conversation in conversations]
+
+
+def load_conversations(path):
+    """Yield the conversations saved one per line in `path`.
+
+    Some of the saved files escaped newlines as a literal "\\n" and some replaced them with spaces;
+    both are turned back into plain whitespace here. A few lines were written as cp1252 rather than
+    UTF-8 (Windows), so those are decoded as cp1252.
+    """
+    with open(path, "rb") as f:
+        for raw in f:
+            try:
+                line = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                line = raw.decode("cp1252", errors="replace")
+            line = line.rstrip("\r\n").replace("\\n", "\n")
+            if line.strip():
+                yield line
@@ -0,0 +1,140 @@
+"""Cheap local checks that run before a conversation is sent to the model for a quality rating.
+
+Every scorer looks at the generated part of a conversation and returns a Verdict: "reject" or
+"accept" with a confidence in [0, 1], or None if it has no opinion. PrefilterCascade rejects a
+conversation if any scorer rejects it with at least `reject_confidence`, optionally auto-accepts it
+if every scorer accepts it with at least `accept_confidence`, and otherwise leaves it to the model.
+
+Confidences are calibrated on the length of MAX_NEW_TOKENS (128 token) generations: an "accept" is 0.9
+when the evidence is strong (a full-length, multi-turn, non-repetitive conversation) and 0.6 - 0.7 when it
+is only adequate. MAX_ACCEPT_CONFIDENCE is the highest accept confidence the default scorers return, so
+a higher `accept_confidence` could never fire and is refused. At 0.9 it auto-accepts about a third of
+both new_data/ (340 of 1021) and incorrect_data/ (374 of 1245): these heuristics only say a conversation
+is well-formed, not that it is good, which is why auto-accept is off by default.
+"""
+import re
+import threading
+from collections import namedtuple
+
+from normalizer import parse_turns
+
+Verdict = namedtuple("Verdict", ["decision", "confidence", "reason"])
+
+REJECT_CONFIDENCE = 0.8
+MAX_ACCEPT_CONFIDENCE = 0.9  # highest "accept" confidence any default scorer returns
+WORD = re.compile(r"\w+")
+# Phrases from the <SYS> prompt that should never show up in the generated turns
+LEAK_MARKERS = ("<sys>", "</sys>", "synthetic conversations between a human user and an ai assistant")
+
+
+def generated_turns(conversation):
+    """The turns the model wrote: everything after the system message and the seed user message."""
+    turns = parse_turns(conversation)
+    if turns and turns[0][0] == "SYSTEM":
+        turns = turns[1:]
+    if turns and turns[0][0] == "USER":
+        turns = turns[1:]
+    return turns
+
+
+def length_scorer(turns):
+    words = sum(len(WORD.findall(text)) for _, text in turns)
+    if words < 20:
+        return Verdict("reject", 0.9, f"only {words} generated words")
+    if words < 40:
+        return Verdict("reject", 0.5, f"only {words} generated words")
+    if words >= 80:
+        # close to everything MAX_NEW_TOKENS allows, i.e. the model did not stop early
+        return Verdict("accept", 0.9, f"{words} generated words")
+    return Verdict("accept", 0.6, f"{words} generated words")
+
+
+def turn_count_scorer(turns):
+    assistant_turns = sum(role == "ASSISTANT" for role, _ in turns)
+    if assistant_turns == 0:
+        return Verdict("reject", 0.95, "no assistant turn")
+    if assistant_turns >= 3:
+        return Verdict("accept", 0.9, f"{assistant_turns} assistant turns")
+    if assistant_turns >= 2:
+        return Verdict("accept", 0.6, f"{assistant_turns} assistant turns")
+    return None
+
+
+def repetition_scorer(turns):
+    """Share of repeated word trigrams; looping output ("I think that ... I think that ...") scores high."""
+    words = WORD.findall(" ".join(text for _, text in turns).lower())
+    trigrams = list(zip(words, words[1:], words[2:]))
+    if not trigrams:
+        return None
+    repeated = 1 - len(set(trigrams)) / len(trigrams)
+    if repeated >= 0.5:
+        return Verdict("reject", 0.9, f"{repeated:.0%} repeated trigrams")
+    if repeated >= 0.3:
+        return Verdict("reject", 0.6, f"{repeated:.0%} repeated trigrams")
+    if repeated < 0.05:
+        return Verdict("accept", 0.9, f"{repeated:.0%} repeated trigrams")
+    return Verdict("accept", 0.7, f"{repeated:.0%} repeated trigrams")
+
+
+def leakage_scorer(turns):
+    text = " ".join(text for _, text in turns).lower()
+    for marker in LEAK_MARKERS:
+        if marker in text:
+            return Verdict("reject", 0.95, f"system prompt leaked ({marker!r})")
+    return None
+
+
+DEFAULT_SCORERS = (leakage_scorer, turn_count_scorer, length_scorer, repetition_scorer)
+
+
+class PrefilterCascade:
+    """Runs `scorers` over a conversation and decides whether the model needs to rate it.
+
+    Args:
+    - scorers (sequence): Functions taking the generated (role, text) turns and returning a Verdict or None.
+    - reject_confidence (float): A single reject verdict at or above this confidence rejects the conversation.
+    - accept_confidence (float or None): If set, a conversation every scorer accepts at or above this
+                                          confidence is accepted without a model call (off by default).
+                                          With DEFAULT_SCORERS it must be at most MAX_ACCEPT_CONFIDENCE (0.9).
+    - reject_quality / accept_quality (int): Quality recorded for rejected / accepted conversations.
+    """
+
+    def __init__(self, scorers=DEFAULT_SCORERS, reject_confidence=REJECT_CONFIDENCE, accept_confidence=None,
+                 reject_quality=1, accept_quality=4):
+        if accept_confidence is not None and scorers is DEFAULT_SCORERS and accept_confidence > MAX_ACCEPT_CONFIDENCE:
+            raise ValueError(
+                f"accept_confidence={accept_confidence} can never be reached: the default scorers accept with "
+                f"at most {MAX_ACCEPT_CONFIDENCE}"
+            )
+        self.scorers = scorers
+        self.reject_confidence = reject_confidence
+        self.accept_confidence = accept_confidence
+        self.reject_quality = reject_quality
+        self.accept_quality = accept_quality
+        self.counts = {"rejected": 0, "accepted": 0, "sent_to_model": 0}
+        self.lock = threading.Lock()
+
+    def evaluate(self, conversation):
+        """Return (decision, quality, reasons): decision is "reject", "accept" or None (ask the model)."""
+        turns = generated_turns(conversation)
+        verdicts = [verdict for verdict in (scorer(turns) for scorer in self.scorers) if verdict is not None]
+        rejects = [v for v in verdicts if v.decision == "reject" and v.confidence >= self.reject_confidence]
+        if rejects:
+            return self._count("reject", self.reject_quality, [v.reason for v in rejects])
+        if (
+            self.accept_confidence is not None
+            and verdicts
+            and all(v.decision == "accept" and v.confidence >= self.accept_confidence for v in verdicts)
+        ):
+            return self._count("accept", self.accept_quality, [v.reason for v in verdicts])
+        return self._count(None, None, [])
+
+    def _count(self, decision, quality, reasons):
+        key = {"reject": "rejected", "accept": "accepted", None: "sent_to_model"}[decision]
+        with self.lock:
+            self.counts[key] += 1
+        return decision, quality, reasons
+
+    @property
+    def calls_saved(self):
+        return self.counts["rejected"] + self.counts["accepted"]
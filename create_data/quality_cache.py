@@ -0,0 +1,144 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+# Helper function to normalize a conversation before hashing, so whitespace-only differences share a key
+def normalize_conversation(conversation):
+    return " ".join(conversation.split())
+
+
+def make_key(conversation, prompt_template, model_name):
+    """Content address of a rating: hash of the normalized conversation, the rating prompt and the model.
+
+    Changing the prompt or the model gives new keys, so old ratings are never reused by mistake.
+    """
+    digest = hashlib.sha256()
+    for part in (normalize_conversation(conversation), prompt_template, model_name):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_run_id(seed, generation_inputs):
+    """Id of the conversations generated by one seeded run: the seed plus a hash of everything that shapes a
+    generation (system prompt, model, token / turn limits, seed messages).
+
+    Changing any of them gives a new run id, so a rerun generates fresh conversations instead of reading back
+    ones made under the old settings.
+    """
+    digest = hashlib.sha256()
+    for part in generation_inputs:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f"seed-{seed}-{digest.hexdigest()[:16]}"
+
+
+class QualityCache:
+    """On-disk (SQLite) cache of conversation quality ratings.
+
+    Ratings are stored by content hash (see make_key) instead of by the full conversation text, and
+    the least recently used ratings are evicted once there are more than `max_entries`. The `runs`
+    table remembers which conversation was generated for each (run_id, index) (see make_run_id), so an
+    interrupted run can be resumed without calling the model again for conversations that were already
+    generated or rated; it is bounded the same way, by its own `max_entries` least recently used rows.
+    """
+
+    def __init__(self, path, prompt_template, model_name, max_entries=100000):
+        self.path = path
+        self.prompt_template = prompt_template
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        # one connection shared by all worker threads, guarded by self.lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ratings (key TEXT PRIMARY KEY, quality INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ratings_last_used ON ratings (last_used)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run_id TEXT NOT NULL, idx INTEGER NOT NULL, conversation TEXT NOT NULL, last_used REAL NOT NULL DEFAULT 0, PRIMARY KEY (run_id, idx))"
+        )
+        # caches written before runs were evicted have no last_used column yet
+        if "last_used" not in {row[1] for row in self.conn.execute("PRAGMA table_info(runs)")}:
+            self.conn.execute("ALTER TABLE runs ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS runs_last_used ON runs (last_used)")
+        self.conn.commit()
+        # row counts are read once here and kept up to date on insert / evict, so a put never has to count the table
+        self.sizes = {
+            table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("ratings", "runs")
+        }
+
+    def get(self, conversation):
+        """Return the cached quality of `conversation`, or None if it has not been rated yet."""
+        key = make_key(conversation, self.prompt_template, self.model_name)
+        with self.lock:
+            row = self.conn.execute("SELECT quality FROM ratings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE ratings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, conversation, quality):
+        key = make_key(conversation, self.prompt_template, self.model_name)
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM ratings WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ratings (key, quality, last_used) VALUES (?, ?, ?)",
+                (key, quality, time.time()),
+            )
+            self._evict("ratings", added=0 if exists else 1)
+            self.conn.commit()
+
+    def _evict(self, table, added):
+        # count the `added` new rows of `table` and drop its least recently used rows once it is over the size bound
+        self.sizes[table] += added
+        extra = self.sizes[table] - self.max_entries
+        if extra > 0:
+            deleted = self.conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY last_used LIMIT ?)",
+                (extra,),
+            ).rowcount
+            self.sizes[table] -= deleted
+            self.evictions += deleted
+
+    def get_generated(self, run_id, idx):
+        """Return the conversation generated for `idx` in `run_id` before, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT conversation FROM runs WHERE run_id = ? AND idx = ?", (run_id, idx)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE runs SET last_used = ? WHERE run_id = ? AND idx = ?", (time.time(), run_id, idx)
+            )
+            self.conn.commit()
+        return row[0]
+
+    def put_generated(self, run_id, idx, conversation):
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM runs WHERE run_id = ? AND idx = ?", (run_id, idx)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, idx, conversation, last_used) VALUES (?, ?, ?, ?)",
+                (run_id, idx, conversation, time.time()),
+            )
+            self._evict("runs", added=0 if exists else 1)
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": self.sizes["ratings"], "generated": self.sizes["runs"]}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
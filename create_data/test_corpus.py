@@ -0,0 +1,63 @@
+import glob
+import os
+
+import pytest
+
+from corpus import CorpusReader, CorpusWriter, convert
+from normalizer import load_conversations, render_turns
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATASETS = sorted(glob.glob(os.path.join(HERE, "new_data", "*.txt")) + glob.glob(os.path.join(HERE, "incorrect_data", "*.txt")))
+
+CONVERSATIONS = [
+    "<SYS> Be nice. </SYS> USER: Hi! ASSISTANT: Hello, how can I help? USER: Tell me more. ASSISTANT: Sure.",
+    "<SYS> Be nice. </SYS> USER: Hi! ASSISTANT: Same system and seed message, different reply.",
+    "USER: No system message here. ASSISTANT: Café, naïve, 日本語 and 🙂 survive.",
+    "ASSISTANT: Only generated text.",
+    "  <SYS>x</SYS>USER:Hi!ASSISTANT:   by  meaning ? \n\n USER:\tnewlines\nand tabs ASSISTANT: USER: ",
+    "",
+]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "small.corpus")
+    with CorpusWriter(path) as writer:
+        for conversation in CONVERSATIONS:
+            writer.add(conversation)
+    with CorpusReader(path) as reader:
+        assert len(reader) == len(CONVERSATIONS)
+        # the system message and the seed message are stored once
+        assert reader.strings == ["<SYS> Be nice. </SYS> ", " Hi! ", " No system message here. ", "  <SYS>x</SYS>", "Hi!"]
+        for n, conversation in enumerate(CONVERSATIONS):
+            assert reader[n] == conversation
+            turns = list(reader.iter_turns(n))
+            for k, turn in enumerate(turns):
+                assert reader.turn(n, k) == turn
+            with pytest.raises(IndexError):
+                reader.turn(n, len(turns))
+        assert list(reader.iter_turns(4)) == [("SYSTEM", "  <SYS>x</SYS>"), ("USER", "Hi!"),
+                                              ("ASSISTANT", "   by  meaning ? \n\n "), ("USER", "\tnewlines\nand tabs "),
+                                              ("ASSISTANT", " "), ("USER", " ")]
+        assert list(reader) == CONVERSATIONS
+        with pytest.raises(IndexError):
+            reader[len(CONVERSATIONS)]
+
+
+def test_round_trip_from_turn_lists(tmp_path):
+    turns = [("SYSTEM", "sys"), ("USER", "seed"), ("ASSISTANT", "a"), ("USER", "b"), ("ASSISTANT", "")]
+    path = str(tmp_path / "turns.corpus")
+    with CorpusWriter(path) as writer:
+        writer.add(turns)
+    with CorpusReader(path) as reader:
+        assert reader[0] == render_turns(turns)
+
+
+@pytest.mark.skipif(not DATASETS, reason="datasets not available")
+@pytest.mark.parametrize("dataset", DATASETS, ids=os.path.basename)
+def test_convert_dataset(tmp_path, dataset):
+    output = convert(dataset, str(tmp_path / "converted.corpus"))
+    conversations = list(load_conversations(dataset))
+    with CorpusReader(output) as reader:
+        assert len(reader) == len(conversations)
+        for n, conversation in enumerate(conversations):
+            assert reader[n] == conversation
@@ -0,0 +1,96 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import data_creation
+from fake_backend import make_fake_mistral
+
+
+@pytest.fixture(autouse=True)
+def quality_cache_in_tmp(tmp_path, monkeypatch):
+    # every test gets its own, empty quality cache instead of ./quality_cache.sqlite3
+    monkeypatch.setattr(data_creation, "CACHE_PATH", str(tmp_path / "quality_cache.sqlite3"))
+    monkeypatch.setattr(data_creation, "_quality_cache", None)
+
+
+def run(num_workers, seed=1, jitter=0.0):
+    records = data_creation.run_pipeline(
+        num_conversations=24,
+        num_workers=num_workers,
+        requests_per_second=10000,
+        burst_size=100,
+        seed=seed,
+        backend=make_fake_mistral(jitter=jitter, seed=7),
+        resume=False,
+    )
+    return [(record["idx"], record["user_message"], record["text"], record["quality"]) for record in records]
+
+
+def test_run_pipeline_is_deterministic_under_jitter():
+    # with jitter, workers finish in a different order every run; the output must not depend on it
+    sequential = run(num_workers=1)
+    assert [record[0] for record in sequential] == list(range(24))
+    assert run(num_workers=6, jitter=0.01) == sequential
+    assert run(num_workers=3, jitter=0.01) == sequential
+
+
+def test_ordered_map_keeps_order_with_a_window_wider_than_the_pool():
+    rng = random.Random(0)
+    delays = [rng.choice([0.0, 0.0, 0.0, 0.02]) for _ in range(40)]
+
+    def slow_square(i):
+        time.sleep(delays[i])
+        return i * i
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert list(data_creation.ordered_map(executor, slow_square, range(40), window=12)) == [i * i for i in range(40)]
+
+
+def test_run_pipeline_depends_on_seed():
+    assert [record[1] for record in run(num_workers=2, seed=1)] != [record[1] for record in run(num_workers=2, seed=2)]
+
+
+def feed(stop, tokens):
+    """Number of tokens consumed before `stop` fires (len(tokens) if it never does)."""
+    for count, token in enumerate(tokens, start=1):
+        if stop(token):
+            return count
+    return len(tokens)
+
+
+@pytest.mark.parametrize("tokens", [
+    ["Hi there. ", "USER: ok ", "ASSISTANT: one. ", "USER: x ", "ASSISTANT: two. ", "USER: y ", "ASSISTANT: three."],
+    ["Hi there. USER: ok ASSI", "STANT: one. USER: x A", "SSISTANT", ": two. USER: y ", "ASSISTANT:", " three."],
+    ["Hi there. USER: ok ", "A", "S", "S", "I", "S", "T", "A", "N", "T", ":", " one. USER: x ASSISTANT: two.",
+     " USER: y ASSISTANT", ": three."],
+])
+def test_stop_after_turns_handles_markers_split_across_tokens(tokens):
+    # the first turn has no marker (the prompt ends with "ASSISTANT:"), so the third marker starts turn 4
+    stop = data_creation.stop_after_turns(3)
+    consumed = feed(stop, tokens)
+    assert "three" not in "".join(tokens[:consumed - 1])
+    assert "".join(tokens[:consumed]).count("ASSISTANT:") == 3
+
+
+def test_stop_after_turns_never_counts_a_marker_twice():
+    stop = data_creation.stop_after_turns(2)
+    # "ASSISTANT:" is kept in the tail of the previous token; it must not be counted again
+    assert feed(stop, ["one. ", "ASSISTANT:", " two.", " more", " words"]) == 5
+
+
+def test_stop_after_turns_reset_starts_counting_again():
+    stop = data_creation.stop_after_turns(1)
+    assert stop("one. ASSISTANT: two")
+    stop.reset()
+    assert not stop("one. ")
+    assert stop("ASSISTANT: two")
+
+
+def test_generate_conversation_is_capped_at_max_assistant_turns():
+    backend = make_fake_mistral(seed=3)
+    for message in data_creation.USER_MESSAGES[:10]:
+        conversation = data_creation.generate_conversation(message, backend=backend)
+        generated = conversation.split(" USER: " + message, 1)[1]
+        assert generated.count("ASSISTANT:") <= data_creation.MAX_ASSISTANT_TURNS
@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+from dedup import DedupIndex, MinHasher, conversation_words, shingle_hashes
+
+WORDS = ("alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa "
+         "quebec romeo sierra tango uniform victor whiskey xray yankee zulu").split()
+
+
+def conversation(words, system="<SYS> Be nice. </SYS>"):
+    half = len(words) // 2
+    return f"{system} USER: {' '.join(words[:half])} ASSISTANT: {' '.join(words[half:])}"
+
+
+def test_words_leave_out_the_system_message():
+    assert conversation_words("<SYS> Be nice. </SYS> USER: Hi, there! ASSISTANT: Hello.") == ["hi", "there", "hello"]
+
+
+def test_short_texts_still_get_one_shingle():
+    assert len(shingle_hashes(["just", "two"])) == 1
+    assert len(shingle_hashes([])) == 0
+
+
+@pytest.mark.parametrize("overlap", [0.0, 0.25, 0.5, 0.75, 1.0])
+def test_minhash_similarity_estimates_jaccard(overlap):
+    rng = random.Random(int(overlap * 100))
+    first = [rng.choice(WORDS) for _ in range(300)]
+    second = [word if rng.random() < overlap else rng.choice(WORDS) + "x" for word in first]
+    a, b = set(shingle_hashes(first).tolist()), set(shingle_hashes(second).tolist())
+    jaccard = len(a & b) / len(a | b)
+    hasher = MinHasher(num_perm=512)
+    estimate = float(np.mean(hasher.signature(shingle_hashes(first)) == hasher.signature(shingle_hashes(second))))
+    assert estimate == pytest.approx(jaccard, abs=0.08)
+
+
+def test_near_duplicates_join_the_first_conversations_cluster():
+    rng = random.Random(1)
+    words = [rng.choice(WORDS) for _ in range(200)]
+    edited = list(words)
+    edited[100] = "changed"  # one word out of 200
+    index = DedupIndex(threshold=0.8)
+    assert index.add("original", conversation(words)) is None
+    # whitespace, case and the system message do not matter
+    assert index.add("reformatted", conversation([word.upper() for word in words], system="<SYS> Other. </SYS>")
+                     .replace(" ", "  \n")) == "original"
+    assert index.add("edited", conversation(edited)) == "original"
+    assert index.add("different", conversation([rng.choice(WORDS) for _ in range(200)])) is None
+    clusters = index.duplicate_clusters()
+    assert list(clusters) == ["original"]
+    assert [key for key, _ in clusters["original"]] == ["reformatted", "edited"]
+    assert clusters["original"][0][1] == 1.0
+    assert 0.8 <= clusters["original"][1][1] < 1.0
+
+
+def test_threshold_decides_what_counts_as_a_duplicate():
+    rng = random.Random(2)
+    words = [rng.choice(WORDS) for _ in range(200)]
+    edited = [word if i % 40 else "changed" for i, word in enumerate(words)]  # 5 words out of 200
+    strict, loose = DedupIndex(threshold=0.95), DedupIndex(threshold=0.5)
+    for index in (strict, loose):
+        index.add("original", conversation(words))
+    assert strict.add("edited", conversation(edited)) is None
+    assert loose.add("edited", conversation(edited)) == "original"
+    assert 0.5 <= loose.duplicate_clusters()["original"][0][1] < 0.95
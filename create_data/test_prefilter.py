@@ -0,0 +1,79 @@
+import pytest
+
+from prefilter import DEFAULT_SCORERS, MAX_ACCEPT_CONFIDENCE, PrefilterCascade, Verdict, generated_turns
+
+SEED = "<SYS> Be nice. </SYS> USER: Tell me about the ocean."
+SENTENCES = [
+    "The ocean covers most of the planet and holds almost all of its water.",
+    "Tides are driven mostly by the gravity of the moon and partly by the sun.",
+    "Why do you ask, are you planning a trip to the coast this summer?",
+    "Deep trenches reach further down than the tallest mountains reach up.",
+    "Coral reefs shelter a quarter of marine species in a tiny share of the sea.",
+    "Would you like to hear more about whales, currents or marine biology?",
+]
+
+
+def conversation(*turns):
+    return SEED + "".join(f" {role}: {text}" for role, text in turns)
+
+
+GOOD = conversation(("ASSISTANT", " ".join(SENTENCES[:2])), ("USER", "Yes, I am."),
+                    ("ASSISTANT", " ".join(SENTENCES[2:4])), ("USER", "Tell me more."),
+                    ("ASSISTANT", " ".join(SENTENCES[4:])))
+ADEQUATE = conversation(("ASSISTANT", " ".join(SENTENCES[:3])), ("USER", "Sure."), ("ASSISTANT", SENTENCES[3]))
+TOO_SHORT = conversation(("ASSISTANT", "Yes."))
+NO_ASSISTANT = conversation(("USER", "Hello? " * 30))
+LOOPING = conversation(("ASSISTANT", "I think that the ocean is big and " * 12))
+LEAKED = conversation(("ASSISTANT", "As instructed, I generate synthetic conversations between a human user and an AI "
+                                    "assistant. " + " ".join(SENTENCES)))
+
+
+def test_generated_turns_skip_the_system_and_seed_messages():
+    assert generated_turns(TOO_SHORT) == [("ASSISTANT", "Yes.")]
+
+
+@pytest.mark.parametrize("text, reason", [
+    (TOO_SHORT, "generated words"),
+    (NO_ASSISTANT, "no assistant turn"),
+    (LOOPING, "repeated trigrams"),
+    (LEAKED, "system prompt leaked"),
+])
+def test_confident_rejects_skip_the_model(text, reason):
+    cascade = PrefilterCascade()
+    decision, quality, reasons = cascade.evaluate(text)
+    assert (decision, quality) == ("reject", 1)
+    assert any(reason in r for r in reasons)
+
+
+@pytest.mark.parametrize("text", [GOOD, ADEQUATE])
+def test_everything_else_goes_to_the_model_by_default(text):
+    assert PrefilterCascade().evaluate(text) == (None, None, [])
+
+
+def test_auto_accept_needs_every_scorer_to_be_sure():
+    cascade = PrefilterCascade(accept_confidence=MAX_ACCEPT_CONFIDENCE, accept_quality=4)
+    decision, quality, reasons = cascade.evaluate(GOOD)
+    assert (decision, quality, len(reasons)) == ("accept", 4, 3)
+    assert cascade.evaluate(ADEQUATE)[0] is None
+    assert cascade.evaluate(TOO_SHORT)[0] == "reject"
+    assert cascade.counts == {"rejected": 1, "accepted": 1, "sent_to_model": 1}
+    assert cascade.calls_saved == 2
+
+
+def test_unreachable_accept_confidence_is_refused():
+    with pytest.raises(ValueError):
+        PrefilterCascade(accept_confidence=MAX_ACCEPT_CONFIDENCE + 0.01)
+    # custom scorers can use any scale
+    PrefilterCascade(scorers=(lambda turns: Verdict("accept", 1.0, "custom"),), accept_confidence=1.0)
+
+
+def test_default_scorers_reach_max_accept_confidence():
+    turns = generated_turns(GOOD)
+    confidences = [verdict.confidence for verdict in (scorer(turns) for scorer in DEFAULT_SCORERS) if verdict]
+    assert max(confidences) == MAX_ACCEPT_CONFIDENCE
+
+
+def test_reject_threshold_is_inclusive_and_configurable():
+    reject = lambda turns: Verdict("reject", 0.6, "weak")
+    assert PrefilterCascade(scorers=(reject,), reject_confidence=0.6).evaluate(GOOD)[0] == "reject"
+    assert PrefilterCascade(scorers=(reject,), reject_confidence=0.61).evaluate(GOOD)[0] is None
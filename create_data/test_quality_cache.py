@@ -0,0 +1,101 @@
+import itertools
+
+import pytest
+
+import data_creation
+import quality_cache
+from fake_backend import make_fake_mistral
+from quality_cache import QualityCache, make_key, make_run_id
+
+
+class FakeClock:
+    """time.time() stand-in that ticks by one second per call, so last_used never ties."""
+
+    def __init__(self):
+        self.ticks = itertools.count(1)
+
+    def time(self):
+        return float(next(self.ticks))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(quality_cache, "time", FakeClock())
+    cache = QualityCache(str(tmp_path / "quality.sqlite3"), "prompt", "model", max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_keys_ignore_whitespace_but_not_prompt_or_model():
+    key = make_key("USER: hi  ASSISTANT: hello", "prompt", "model")
+    assert make_key(" USER: hi\nASSISTANT: hello ", "prompt", "model") == key
+    assert make_key("USER: hi ASSISTANT: hello", "other prompt", "model") != key
+    assert make_key("USER: hi ASSISTANT: hello", "prompt", "other model") != key
+
+
+def test_least_recently_used_ratings_are_evicted(cache):
+    for n in range(3):
+        cache.put(f"conversation {n}", n + 1)
+    assert cache.get("conversation 0") == 1  # now the most recently used
+    cache.put("conversation 3", 4)
+    assert cache.get("conversation 1") is None
+    assert [cache.get(f"conversation {n}") for n in (0, 2, 3)] == [1, 3, 4]
+    # replacing a rating does not count as a new row
+    cache.put("conversation 3", 5)
+    assert cache.stats()["size"] == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_generated_conversations_are_evicted_by_their_own_bound(cache):
+    for idx in range(5):
+        cache.put_generated("run", idx, f"conversation {idx}")
+        cache.put(f"conversation {idx}", 3)
+    assert [cache.get_generated("run", idx) for idx in range(5)] == [None, None, "conversation 2", "conversation 3",
+                                                                      "conversation 4"]
+    assert cache.stats()["size"] == 3
+    assert cache.stats()["generated"] == 3
+
+
+def test_sizes_survive_reopening(cache):
+    for n in range(5):
+        cache.put(f"conversation {n}", 2)
+        cache.put_generated("run", n, f"conversation {n}")
+    reopened = QualityCache(cache.path, "prompt", "model", max_entries=3)
+    assert (reopened.stats()["size"], reopened.stats()["generated"]) == (3, 3)
+    reopened.close()
+
+
+def test_run_id_changes_with_every_generation_input():
+    inputs = ["<SYS> system </SYS>", "model:v1", 128, 6, "Hi!", "Hello?"]
+    run_id = make_run_id(584, inputs)
+    assert make_run_id(584, list(inputs)) == run_id
+    assert make_run_id(585, inputs) != run_id
+    for i in range(len(inputs)):
+        changed = inputs[:i] + [f"{inputs[i]}!"] + inputs[i + 1:]
+        assert make_run_id(584, changed) != run_id
+
+
+def test_resume_only_reuses_generations_made_with_the_same_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_creation, "CACHE_PATH", str(tmp_path / "quality_cache.sqlite3"))
+    monkeypatch.setattr(data_creation, "_quality_cache", None)
+    fake_mistral = make_fake_mistral(seed=5)
+    calls = []
+
+    def backend(prompt, *args, **kwargs):
+        calls.append(prompt)
+        return fake_mistral(prompt, *args, **kwargs)
+
+    def run():
+        calls.clear()
+        records = list(data_creation.run_pipeline(num_conversations=6, num_workers=2, requests_per_second=10000,
+                                                  burst_size=100, seed=1, backend=backend, resume=True))
+        return [record["text"] for record in records], sum(not prompt.startswith(data_creation.QUALITY_PROMPT[:20])
+                                                           for prompt in calls)
+
+    texts, generated = run()
+    assert generated == 6
+    # same settings: every conversation is read back instead of generated
+    assert run() == (texts, 0)
+    # a changed generation setting gives a new run id, so nothing stale is read back
+    monkeypatch.setattr(data_creation, "MAX_ASSISTANT_TURNS", data_creation.MAX_ASSISTANT_TURNS - 1)
+    assert run()[1] == 6
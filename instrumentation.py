@@ -0,0 +1,253 @@
+"""Per-call latency, token and cost instrumentation shared by create_data/ and chain_of_density_summarization/.
+
+Wrap every LLM call of a pipeline stage in `instrument(stage)` (a context manager that also works as a
+decorator). Each wrapped call records its wall time and whether it raised. Code running inside the call
+adds more to it with add() and tag():
+- llm_client.py adds queue wait (rate limiters and concurrency slots), retries, prompt/completion tokens
+  and the model name;
+- the pipelines add cache hits and misses.
+
+Calls made inside another instrumented call are counted as part of the outer one, so a stage can be
+wrapped at the top (e.g. extract_entities) while the helper it calls (call_LLM_model) is wrapped too.
+A call answered from a cache (add(cache_hits=1)) only counts as a cache hit: it is not an LLM call, and
+its lookup time stays out of the latency percentiles.
+
+Everything goes into the process-wide `metrics`, which can be summarized as JSON (per-stage totals and
+p50/p95/p99 latencies) or written as a Prometheus text file (for node_exporter's textfile collector):
+
+    with instrument("rating"):
+        quality = check_conversation_quality(conversation)
+    metrics.write_json("metrics.json")
+    metrics.write_prometheus("metrics.prom")
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+# USD per 1K (prompt, completion) tokens, looked up without any ":version" suffix; calls to models missing here
+# are reported with a cost of 0. The Replicate entry is the per-token list price of the official model; a
+# pinned version may be billed by GPU time instead, so treat its cost as an estimate.
+PRICES_PER_1K_TOKENS = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "mistralai/mistral-7b-v0.1": (0.00005, 0.00025),
+}
+PERCENTILES = (50, 95, 99)
+COUNTED_FIELDS = ("queue_wait", "retries", "prompt_tokens", "completion_tokens", "cache_hits", "cache_misses")
+
+_stage = contextvars.ContextVar("stage", default="unknown")
+_current_call = contextvars.ContextVar("current_call", default=None)
+
+
+# Helper function for nearest-rank percentiles of an already sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))  # ceil(n * p / 100)
+    return sorted_values[int(rank) - 1]
+
+
+def _distribution(values):
+    values = sorted(values)
+    summary = {"total": sum(values), "mean": sum(values) / len(values) if values else 0.0,
+               "max": values[-1] if values else 0.0}
+    summary.update({f"p{p}": percentile(values, p) for p in PERCENTILES})
+    return summary
+
+
+class Metrics:
+    """Thread-safe collection of per-stage call records.
+
+    Per stage it keeps the wall time and queue wait of every call (for percentiles) and running totals of
+    calls, errors, retries, tokens, cost and cache hits / misses.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.wall = defaultdict(list)
+            self.queue_wait = defaultdict(list)
+            self.totals = defaultdict(Counter)
+
+    def record(self, stage, call):
+        if call.get("cache_hits") and not call.get("error"):
+            # answered from a cache: no model call was made, so no call count and no wall time sample
+            self.count(stage, cache_hits=call["cache_hits"])
+            return
+        cost = 0.0
+        prices = PRICES_PER_1K_TOKENS.get((call.get("model") or "").split(":")[0])
+        if prices is not None:
+            cost = (call.get("prompt_tokens", 0) * prices[0] + call.get("completion_tokens", 0) * prices[1]) / 1000
+        with self.lock:
+            self.wall[stage].append(call["wall"])
+            self.queue_wait[stage].append(call.get("queue_wait", 0.0))
+            totals = self.totals[stage]
+            totals["calls"] += 1
+            totals["errors"] += int(call.get("error", False))
+            totals["cost_usd"] += cost
+            for field in COUNTED_FIELDS:
+                if field != "queue_wait":
+                    totals[field] += call.get(field, 0)
+
+    def count(self, stage, **amounts):
+        """Add to a stage's totals outside of any instrumented call (e.g. a cache hit that needed no call)."""
+        with self.lock:
+            self.totals[stage].update(amounts)
+
+    def summary(self):
+        """Return {"stages": {stage: {...}}, "total": {...}} with totals and wall / queue wait distributions."""
+        with self.lock:
+            stages = {}
+            for stage in sorted(self.totals):
+                totals = self.totals[stage]
+                stages[stage] = {
+                    "calls": totals["calls"],
+                    "errors": totals["errors"],
+                    "retries": totals["retries"],
+                    "cache_hits": totals["cache_hits"],
+                    "cache_misses": totals["cache_misses"],
+                    "prompt_tokens": totals["prompt_tokens"],
+                    "completion_tokens": totals["completion_tokens"],
+                    "cost_usd": totals["cost_usd"],
+                    "wall_seconds": _distribution(self.wall[stage]),
+                    "queue_wait_seconds": _distribution(self.queue_wait[stage]),
+                }
+            all_wall = [value for values in self.wall.values() for value in values]
+        total = {key: sum(stage[key] for stage in stages.values())
+                 for key in ("calls", "errors", "retries", "cache_hits", "cache_misses", "prompt_tokens",
+                             "completion_tokens", "cost_usd")}
+        total["wall_seconds"] = _distribution(all_wall)
+        return {"stages": stages, "total": total}
+
+    def write_json(self, path):
+        _write_atomically(path, json.dumps(self.summary(), indent=2))
+
+    def prometheus_text(self, prefix="llm"):
+        """Summary in the Prometheus text exposition format, one label set per stage."""
+        summary = self.summary()["stages"]
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}")
+
+        counters = [
+            ("calls_total", "calls", "Instrumented LLM calls (answers from a cache are only counted as cache hits)."),
+            ("call_errors_total", "errors", "Instrumented LLM calls that raised."),
+            ("retries_total", "retries", "Retried attempts of LLM calls."),
+            ("cache_hits_total", "cache_hits", "Answers served from a cache."),
+            ("cache_misses_total", "cache_misses", "Cache lookups that needed a model call."),
+            ("cost_usd_total", "cost_usd", "Estimated cost in USD (see PRICES_PER_1K_TOKENS)."),
+        ]
+        for name, key, help_text in counters:
+            family(name, "counter", help_text, [("", {"stage": stage}, stats[key]) for stage, stats in summary.items()])
+        family("tokens_total", "counter", "Prompt and completion tokens.", [
+            ("", {"stage": stage, "kind": kind}, stats[f"{kind}_tokens"])
+            for stage, stats in summary.items() for kind in ("prompt", "completion")
+        ])
+        for name, key, help_text in (
+            ("call_duration_seconds", "wall_seconds", "Wall time of LLM calls."),
+            ("queue_wait_seconds", "queue_wait_seconds", "Time LLM calls waited for rate limits and call slots."),
+        ):
+            samples = []
+            for stage, stats in summary.items():
+                distribution = stats[key]
+                samples += [("", {"stage": stage, "quantile": str(p / 100)}, distribution[f"p{p}"]) for p in PERCENTILES]
+                samples.append(("_sum", {"stage": stage}, distribution["total"]))
+                samples.append(("_count", {"stage": stage}, stats["calls"]))
+            family(name, "summary", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="llm"):
+        # written to a temporary file first, so a scraper never reads a half-written file
+        _write_atomically(path, self.prometheus_text(prefix))
+
+
+def _write_atomically(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+class instrument:
+    """Record one call under `stage` (or the enclosing stage if None), as a context manager or decorator.
+
+        with instrument("entity_extraction"):
+            ...
+
+        @instrument("densification")
+        def increase_density_response(...):
+            ...
+    """
+
+    def __init__(self, stage=None, sink=None):
+        self.stage = stage
+        self.sink = sink or metrics
+        self.call = None
+        self.tokens = None
+
+    def __enter__(self):
+        if _current_call.get() is not None:
+            # nested inside another instrumented call, which already records everything
+            return self
+        self.call = {"queue_wait": 0.0}
+        self.tokens = [_current_call.set(self.call)]
+        if self.stage is not None:
+            self.tokens.append(_stage.set(self.stage))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.call is None:
+            return False
+        self.call["wall"] = time.perf_counter() - self.start
+        self.call["error"] = exc_type is not None
+        stage = _stage.get()
+        for token in reversed(self.tokens):
+            token.var.reset(token)
+        self.sink.record(stage, self.call)
+        self.call = self.tokens = None
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with instrument(self.stage, self.sink):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+def current_stage():
+    return _stage.get()
+
+
+def add(**amounts):
+    """Add numbers (queue_wait, retries, prompt_tokens, completion_tokens, cache_hits, cache_misses) to the
+    current instrumented call, or straight to the current stage's totals when no call is being recorded."""
+    call = _current_call.get()
+    if call is None:
+        metrics.count(_stage.get(), **amounts)
+        return
+    for key, amount in amounts.items():
+        call[key] = call.get(key, 0) + amount
+
+
+def tag(**values):
+    """Set labels (e.g. model) on the current instrumented call; ignored outside of one."""
+    call = _current_call.get()
+    if call is not None:
+        call.update(values)
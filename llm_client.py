@@ -0,0 +1,325 @@
+"""Shared LLM client layer used by create_data/ and chain_of_density_summarization/.
+
+One LLMClient per backend is kept for the whole process (see get_client), so HTTP connections are
+pooled and reused instead of being set up for every call. Every call goes through the backend's
+limits (concurrent calls, requests per second, tokens per minute) and transient failures (429, 5xx,
+timeouts, dropped connections) are retried with exponential backoff and jitter. Anything that still
+fails raises LLMError, instead of being turned into an empty answer. Queue wait, retries and token
+counts of every call are added to the caller's instrumented call (see instrumentation.py).
+
+Backends:
+- "openai": OpenAI chat completions over a pooled requests.Session.
+- "llama": the same OpenAI-compatible protocol pointed at a local server (llm_stub_server.py by
+  default, or any OpenAI-compatible llama server), for offline runs and load tests.
+- "replicate": streaming text generation through one replicate.Client; a prediction whose stream is
+  abandoned early is cancelled, so it stops generating (and being billed) on Replicate's side too.
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 60
+
+
+class LLMError(Exception):
+    """An LLM call failed for good (a non-retryable error, or retries ran out)."""
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens are added per second, up to `capacity`.
+
+    acquire(n) blocks until n tokens are available, so all threads sharing a bucket together never go
+    faster than `rate` per second (after an initial burst of at most `capacity`).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # a request bigger than the whole bucket would wait forever, so cap it at the capacity
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            # sleep outside the lock so other threads can keep refilling / checking
+            time.sleep(wait)
+
+
+# Rough token count used for token-rate limiting before the real count is known
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class OpenAICompatibleBackend:
+    """Chat completions over HTTP for OpenAI and any OpenAI-compatible server (e.g. the local llama stub)."""
+
+    def __init__(self, base_url, model, api_key=None, organization=None, pool_size=16, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.resize_pool(pool_size)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        if organization:
+            self.session.headers["OpenAI-Organization"] = organization
+
+    def resize_pool(self, pool_size):
+        """Keep up to `pool_size` keep-alive connections (one per concurrent call), shared by every thread."""
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def chat(self, messages, temperature=0, max_tokens=None):
+        payload = {"model": self.model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        try:
+            response = self.session.post(f"{self.base_url}/chat/completions", json=payload, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise LLMError(f"{self.base_url}: {e}", retryable=True) from e
+        if response.status_code != 200:
+            raise LLMError(
+                f"{self.base_url} returned {response.status_code}: {response.text[:200]}",
+                status=response.status_code,
+                retryable=response.status_code in RETRY_STATUSES,
+            )
+        return response.json()
+
+
+class ReplicateBackend:
+    """Streaming generation through a single replicate.Client (which keeps its own connection pool)."""
+
+    def __init__(self, model, api_token=None):
+        import httpx
+        import replicate
+        from replicate.stream import ServerSentEvent
+
+        self.replicate = replicate
+        self.event_type = ServerSentEvent.EventType
+        self.model = model
+        self.client = replicate.Client(api_token=api_token or os.environ.get("REPLICATE_API_TOKEN"))
+        # the only errors worth retrying besides RETRY_STATUSES: the connection failed, timed out or was dropped
+        self.transport_errors = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+    def _error(self, e):
+        """LLMError for a Replicate / HTTP exception, or None for anything else (e.g. a bug), which is not retried."""
+        exceptions = self.replicate.exceptions
+        if isinstance(e, exceptions.ModelError):
+            # the prediction itself failed; running it again would fail (and be billed) again
+            return LLMError(f"Replicate prediction failed: {e}")
+        if isinstance(e, exceptions.ReplicateError):
+            return LLMError(f"Replicate: {e}", status=e.status, retryable=e.status in RETRY_STATUSES)
+        if isinstance(e, self.transport_errors):
+            return LLMError(f"Replicate: {e}", retryable=True)
+        return None
+
+    def stream(self, prompt, max_new_tokens):
+        """Start a streaming prediction and return a ReplicateStream over its output tokens."""
+        # "owner/name:version" runs that exact version, "owner/name" the model's latest one
+        name, _, version = self.model.partition(":")
+        target = {"version": version} if version else {"model": name}
+        try:
+            prediction = self.client.predictions.create(
+                **target, input={"prompt": prompt, "max_new_tokens": max_new_tokens}, stream=True
+            )
+        except Exception as e:
+            error = self._error(e)
+            if error is None:
+                raise
+            raise error from e
+        return ReplicateStream(self, prediction)
+
+
+class ReplicateStream:
+    """Output tokens of one streaming Replicate prediction, read from its server-sent events.
+
+    close() (LLMClient.complete calls it once `stop` fires, and when the stream fails) closes the HTTP
+    stream and, if the prediction has not finished yet, cancels it, so Replicate stops generating tokens
+    nobody will read.
+    """
+
+    def __init__(self, backend, prediction):
+        self.backend = backend
+        self.prediction = prediction
+        self.events = None
+        self.iterator = None
+        self.finished = False
+
+    def __iter__(self):
+        self.iterator = self._read()
+        return self.iterator
+
+    def _read(self):
+        event_type = self.backend.event_type
+        try:
+            self.events = self.prediction.stream()
+            for event in self.events:
+                if event.event == event_type.OUTPUT:
+                    yield event.data
+                elif event.event == event_type.ERROR:
+                    self.finished = True
+                    raise LLMError(f"Replicate prediction failed: {event.data}")
+                elif event.event == event_type.DONE:
+                    break
+        except LLMError:
+            raise
+        except Exception as e:
+            error = self.backend._error(e)
+            if error is None:
+                raise
+            raise error from e
+        self.finished = True
+
+    def close(self):
+        if self.iterator is not None:
+            self.iterator.close()
+        if self.events is not None:
+            self.events.close()
+        if not self.finished:
+            self.finished = True
+            try:
+                self.prediction.cancel()
+            except Exception as e:
+                # the answer we needed is already here; at worst the prediction runs to max_new_tokens
+                logging.warning(f"Could not cancel Replicate prediction {self.prediction.id}: {e}")
+
+
+class LLMClient:
+    """Applies a backend's concurrency / request-rate / token-rate limits and retries around every call.
+
+    Args:
+    - backend: An OpenAICompatibleBackend, ReplicateBackend or anything with the same chat() / stream() methods.
+    - max_concurrency (int): Calls allowed in flight at once.
+    - requests_per_second (float or None): Request rate limit (None for no limit).
+    - tokens_per_minute (int or None): Estimated prompt + completion token rate limit (None for no limit).
+    - max_retries (int): Retries of retryable failures before LLMError is raised.
+    """
+
+    def __init__(self, backend, max_concurrency=8, requests_per_second=None, tokens_per_minute=None,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.backend = backend
+        self.set_concurrency(max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_second, max(1, requests_per_second)) if requests_per_second else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def set_concurrency(self, max_concurrency):
+        """Allow `max_concurrency` calls in flight and size the backend's connection pool (if it has one) to match.
+
+        Runners call this with their own worker count, so the client never caps them below what they were asked for.
+        Calls already in flight finish under the old limit.
+        """
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        resize_pool = getattr(self.backend, "resize_pool", None)
+        if resize_pool is not None:
+            resize_pool(max_concurrency)
+
+    def _call(self, fn, estimated_tokens):
+        instrumentation.tag(model=getattr(self.backend, "model", None))
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(estimated_tokens)
+            slots = self.slots  # released on the same semaphore even if set_concurrency swaps it meanwhile
+            slots.acquire()
+            instrumentation.add(queue_wait=time.perf_counter() - queued)
+            try:
+                return fn()
+            except LLMError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+            finally:
+                slots.release()
+            instrumentation.add(retries=1)
+            # "full jitter": a random wait up to the exponential backoff, so retries do not line up
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            time.sleep(delay)
+
+    def chat(self, messages, temperature=0, max_tokens=None):
+        """Chat completion; returns the OpenAI-format response dict."""
+        estimated = sum(estimate_tokens(message["content"]) for message in messages) + (max_tokens or 256)
+        response = self._call(lambda: self.backend.chat(messages, temperature=temperature, max_tokens=max_tokens), estimated)
+        usage = response.get("usage") or {}
+        instrumentation.add(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+        return response
+
+    def complete(self, prompt, max_new_tokens=128, stop=None):
+        """Streamed text completion. If `stop` is given, it is called with every token and the stream is
+        abandoned (and closed) as soon as it returns True. A stateful `stop` can have a reset() method,
+        which is called before every attempt so a retry starts counting from scratch. Returns the generated text.
+
+        The backend turns its own transient errors (also those raised while streaming) into retryable LLMErrors;
+        any other exception is not retried."""
+
+        def run():
+            if hasattr(stop, "reset"):
+                stop.reset()
+            output = self.backend.stream(prompt, max_new_tokens)
+            parts = []
+            try:
+                for token in output:
+                    parts.append(token)
+                    if stop is not None and stop(token):
+                        break
+            finally:
+                close = getattr(output, "close", None)
+                if close is not None:
+                    close()
+            # streamed output has no usage report: the prompt is estimated, every streamed item is one token
+            instrumentation.add(prompt_tokens=estimate_tokens(prompt), completion_tokens=len(parts))
+            return "".join(parts)
+
+        return self._call(run, estimate_tokens(prompt) + max_new_tokens)
+
+
+LLAMA_STUB_URL = os.environ.get("LLAMA_BASE_URL", "http://127.0.0.1:8000/v1")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, factory):
+    """Return the process-wide client registered as `name`, creating it with `factory()` on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = factory()
+        return client
+
+
+def set_client(name, client):
+    """Replace the client registered as `name` (e.g. with one around a fake backend)."""
+    with _clients_lock:
+        _clients[name] = client
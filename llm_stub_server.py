@@ -0,0 +1,100 @@
+"""Local OpenAI-compatible stand-in server for offline runs and load tests.
+
+Usage:
+    python llm_stub_server.py --port 8000 --latency 0.2 --error-rate 0.05
+
+Serves POST /v1/chat/completions with deterministic canned answers: entity-extraction prompts get a
+Python list of the capitalized words of the text, densify prompts get the missing entities followed by
+the summary, cut to a few characters over the requested length (as real models tend to overshoot),
+and everything else gets the first words of the prompt back as a "summary". --latency / --jitter delay
+every answer and --error-rate answers a share of requests with 429 or 503, to exercise the retry and
+rate-limit paths of llm_client.py.
+"""
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CAPITALIZED = re.compile(r"\b[A-Z][a-zA-Z]+(?: [A-Z][a-zA-Z]+)*")
+DENSIFY_PROMPT = re.compile(r"at most (\d+) characters long.*?(?:Missing entities|Entity list): (\[.*?\])\. Summary: (.*?)\.(?: Your previous|$)", re.S)
+LENGTH_OVERSHOOT = 1.05
+
+
+def canned_answer(messages):
+    prompt = messages[-1]["content"] if messages else ""
+    text = prompt.split(":", 1)[-1]
+    if prompt.startswith("Extract"):
+        entities = list(dict.fromkeys(CAPITALIZED.findall(text)))[:15]
+        return repr(entities)
+    densify = DENSIFY_PROMPT.search(prompt)
+    if densify:
+        max_length, entities, summary = densify.groups()
+        limit = int(int(max_length) * (1.0 if "Your previous rewrite" in prompt else LENGTH_OVERSHOOT))
+        # the missing entities go first, so some of them survive the cut at the end
+        missing = ", ".join(re.findall(r"'([^']*)'", entities))
+        return f"{missing}: {summary}"[:limit].strip()
+    return " ".join(text.split()[:60])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled connections are actually reused
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+        request = json.loads(body or b"{}")
+        time.sleep(self.latency + random.random() * self.jitter)
+        if random.random() < self.error_rate:
+            status = random.choice((429, 503))
+            return self._send(status, {"error": {"message": "stub server injected error"}})
+        messages = request.get("messages", [])
+        content = canned_answer(messages)
+        prompt_tokens = sum(len(message.get("content", "")) // 4 for message in messages)
+        completion_tokens = len(content) // 4
+        self._send(200, {
+            "id": "stub",
+            "object": "chat.completion",
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep load tests quiet
+
+
+def make_server(host="127.0.0.1", port=8000, latency=0.0, jitter=0.0, error_rate=0.0):
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "jitter": jitter, "error_rate": error_rate})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds in [0, jitter)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/503")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Stub server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from checkpoint import JsonlCheckpointWriter, _drop_partial_line, completed_indices, read_records
+
+CASES = [
+    b"",
+    b"\n",
+    b'{"idx": 0}\n',
+    b'{"idx": 0}\n{"idx": 1}\n',
+    b'{"idx": 0}\n{"idx": 1, "te',
+    b'{"idx": 0, "text": "no newline at all"',
+    b'{"idx": 0}\n' + b"x" * 300,
+    b"y" * 300 + b"\n" + b"z" * 5,
+]
+
+
+@pytest.mark.parametrize("data", CASES)
+@pytest.mark.parametrize("block_size", [1, 2, 7, 64, 64 * 1024])
+def test_drop_partial_line_keeps_everything_up_to_the_last_newline(tmp_path, data, block_size):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(data)
+    _drop_partial_line(str(path), block_size=block_size)
+    assert path.read_bytes() == data[:data.rfind(b"\n") + 1]
+
+
+def test_drop_partial_line_ignores_missing_files(tmp_path):
+    _drop_partial_line(str(tmp_path / "missing.jsonl"))
+    assert not (tmp_path / "missing.jsonl").exists()
+
+
+def test_writer_appends_after_a_torn_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"idx": 0, "seed": 1}\n{"idx": 1, "se', encoding="utf-8")
+    with JsonlCheckpointWriter(str(path), fsync_every=1) as writer:
+        writer.write({"idx": 1, "seed": 1, "text": "ü\nnewline"})
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["idx"] for line in lines] == [0, 1]
+    assert completed_indices([str(path), str(tmp_path / "missing.jsonl")], seed=1) == {0, 1}
+    assert completed_indices([str(path)], seed=2) == set()
+
+
+def test_read_records_skips_lines_that_do_not_parse(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"idx": 0}\n\nnot json\n{"idx": 2}\n{"idx": 3', encoding="utf-8")
+    assert list(read_records(str(path))) == [{"idx": 0}, {"idx": 2}]
@@ -0,0 +1,74 @@
+import pytest
+
+from instrumentation import Metrics, add, instrument, percentile, tag
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) == 0.0
+    assert percentile([1, 2, 3], 50) == 2
+
+
+def test_cache_hits_are_not_calls_and_stay_out_of_latency():
+    sink = Metrics()
+    for wall in (0.1, 0.2, 0.3, 0.4):
+        sink.record("rating", {"wall": wall, "cache_misses": 1, "prompt_tokens": 10, "completion_tokens": 1})
+    for _ in range(20):
+        sink.record("rating", {"wall": 0.0001, "cache_hits": 1})
+    stats = sink.summary()["stages"]["rating"]
+    assert (stats["calls"], stats["cache_hits"], stats["cache_misses"]) == (4, 20, 4)
+    assert stats["wall_seconds"]["p50"] == 0.2
+    assert stats["wall_seconds"]["p95"] == stats["wall_seconds"]["max"] == 0.4
+    assert stats["prompt_tokens"] == 40
+
+
+def test_a_failed_cache_hit_still_counts_as_a_call():
+    sink = Metrics()
+    sink.record("rating", {"wall": 0.5, "cache_hits": 1, "error": True})
+    stats = sink.summary()["stages"]["rating"]
+    assert (stats["calls"], stats["errors"]) == (1, 1)
+
+
+def test_cost_uses_the_model_without_its_version():
+    sink = Metrics()
+    sink.record("generation", {"wall": 1.0, "model": "mistralai/mistral-7b-v0.1:3e8a0fb6", "prompt_tokens": 1000,
+                               "completion_tokens": 2000})
+    sink.record("generation", {"wall": 1.0, "model": "unknown-model", "prompt_tokens": 1000})
+    assert sink.summary()["stages"]["generation"]["cost_usd"] == pytest.approx(0.00005 + 2 * 0.00025)
+
+
+def test_nested_calls_are_recorded_once_under_the_outer_stage():
+    sink = Metrics()
+    with instrument("entity_extraction", sink=sink):
+        tag(model="gpt-3.5-turbo")
+        with instrument("inner", sink=sink):
+            add(prompt_tokens=1000, completion_tokens=1000, retries=1)
+    stats = sink.summary()["stages"]
+    assert list(stats) == ["entity_extraction"]
+    assert (stats["entity_extraction"]["calls"], stats["entity_extraction"]["retries"]) == (1, 1)
+    assert stats["entity_extraction"]["cost_usd"] == pytest.approx(0.0015 + 0.002)
+
+
+def test_errors_are_recorded_and_raised():
+    sink = Metrics()
+
+    @instrument("rating", sink=sink)
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        fail()
+    assert sink.summary()["stages"]["rating"]["errors"] == 1
+
+
+def test_prometheus_summary_counts_calls_not_cache_hits():
+    sink = Metrics()
+    sink.record("rating", {"wall": 0.2})
+    sink.record("rating", {"wall": 0.0, "cache_hits": 1})
+    text = sink.prometheus_text()
+    assert 'llm_calls_total{stage="rating"} 1' in text
+    assert 'llm_cache_hits_total{stage="rating"} 1' in text
+    assert 'llm_call_duration_seconds_count{stage="rating"} 1' in text
+    assert 'llm_call_duration_seconds{stage="rating",quantile="0.95"} 0.2' in text
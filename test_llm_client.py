@@ -0,0 +1,138 @@
+import types
+
+import httpx
+import pytest
+import requests
+import replicate
+
+from instrumentation import Metrics, instrument
+from llm_client import LLMClient, LLMError, OpenAICompatibleBackend, ReplicateBackend
+
+
+class FlakyBackend:
+    """chat() raises the queued errors one per call, then answers."""
+
+    model = "flaky"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def chat(self, messages, temperature=0, max_tokens=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"choices": [{"message": {"content": "ok"}}], "usage": {"prompt_tokens": 3, "completion_tokens": 1}}
+
+
+def client(backend, max_retries=3):
+    return LLMClient(backend, max_retries=max_retries, backoff_base=0.0001)
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_retryable_errors_are_retried_until_the_call_succeeds():
+    backend = FlakyBackend(LLMError("busy", status=503, retryable=True), LLMError("timeout", retryable=True))
+    sink = Metrics()
+    with instrument("test", sink=sink):
+        assert client(backend).chat(MESSAGES)["choices"][0]["message"]["content"] == "ok"
+    assert backend.calls == 3
+    assert sink.summary()["stages"]["test"]["retries"] == 2
+
+
+def test_retries_run_out():
+    backend = FlakyBackend(*[LLMError("busy", status=503, retryable=True)] * 10)
+    with pytest.raises(LLMError) as raised:
+        client(backend, max_retries=3).chat(MESSAGES)
+    assert raised.value.status == 503
+    assert backend.calls == 4
+
+
+@pytest.mark.parametrize("error", [LLMError("bad request", status=400), KeyError("a bug")])
+def test_non_retryable_errors_are_raised_at_once(error):
+    backend = FlakyBackend(error)
+    with pytest.raises(type(error)):
+        client(backend).chat(MESSAGES)
+    assert backend.calls == 1
+
+
+def test_stateful_stop_is_reset_before_every_attempt():
+    class Backend:
+        model = "stream"
+        attempts = 0
+
+        def stream(self, prompt, max_new_tokens):
+            self.attempts += 1
+            if self.attempts == 1:
+                yield "one "
+                raise LLMError("dropped", retryable=True)
+            yield from ["one ", "two ", "three "]
+
+    class StopAfterTwo:
+        def __init__(self):
+            self.seen = 0
+
+        def reset(self):
+            self.seen = 0
+
+        def __call__(self, token):
+            self.seen += 1
+            return self.seen == 2
+
+    assert client(Backend()).complete("prompt", stop=StopAfterTwo()) == "one two "
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "error body"
+
+    def json(self):
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+
+@pytest.mark.parametrize("outcome, retryable", [
+    (FakeResponse(429), True),
+    (FakeResponse(503), True),
+    (FakeResponse(400), False),
+    (FakeResponse(401), False),
+    (requests.ConnectionError("refused"), True),
+    (requests.Timeout("slow"), True),
+])
+def test_openai_backend_marks_only_transient_failures_retryable(outcome, retryable):
+    backend = OpenAICompatibleBackend("http://stub/v1", "model")
+
+    def post(*args, **kwargs):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    backend.session.post = post
+    with pytest.raises(LLMError) as raised:
+        backend.chat(MESSAGES)
+    assert raised.value.retryable is retryable
+
+
+@pytest.mark.parametrize("error, calls", [
+    (replicate.exceptions.ModelError(types.SimpleNamespace(error="CUDA out of memory", id="p", status="failed")), 1),
+    (replicate.exceptions.ReplicateError(status=422, detail="invalid input"), 1),
+    (replicate.exceptions.ReplicateError(status=503, detail="busy"), 4),
+    (httpx.ConnectError("refused"), 4),
+    (httpx.ReadTimeout("slow"), 4),
+    (KeyError("a bug"), 1),
+])
+def test_replicate_backend_only_retries_transport_errors_and_retryable_statuses(error, calls):
+    backend = ReplicateBackend("owner/model:version", api_token="token")
+    attempts = []
+
+    def create(**kwargs):
+        attempts.append(kwargs)
+        raise error
+
+    backend.client = types.SimpleNamespace(predictions=types.SimpleNamespace(create=create))
+    with pytest.raises((LLMError, KeyError)) as raised:
+        client(backend, max_retries=3).complete("prompt")
+    assert len(attempts) == calls
+    assert isinstance(raised.value, KeyError) == isinstance(error, KeyError)
+    assert attempts[0]["version"] == "version" and attempts[0]["stream"] is True